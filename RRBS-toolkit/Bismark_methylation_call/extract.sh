@@ -87,7 +87,7 @@ fi
 echo "Done !"
 
 echo "bismark extraction running (2) ..."
-$PYTHON_EXECUTE $RRBS_PIPELINE_HOME/parse_extract.py $dir_data 
+$PYTHON_EXECUTE $RRBS_PIPELINE_HOME/parse_extract.py --jobs ${PARSE_EXTRACT_JOBS:-1} $dir_data 
 if [ $? -ne 0 ]
 then
     echo "bismark extraction failed (2)"
@@ -105,7 +105,7 @@ if [ $R2 -eq 1 ]
 	then
 
 	echo "R1<->R2 distance extraction running ..."
-	$PYTHON_EXECUTE $RRBS_PIPELINE_HOME/extract_distance_R1R2.py $dir_data $fileToExtract
+	$PYTHON_EXECUTE $RRBS_PIPELINE_HOME/extract_distance_R1R2.py $DISTANCE_R1R2_OPTIONS $dir_data $fileToExtract
 	if [ $? -ne 0 ]
 	then
     	echo "R1<->R2 distance extraction failed (2)"
@@ -33,12 +33,22 @@ import os
 from string import *
 from sys import argv
 import re
+import argparse
+import subprocess
+import multiprocessing
+
+from methylation_stats import quantile
 
 
 """
+Usage:
+./extract_distance_R1R2.py [--histogram [--jobs N]] dir_data bam_file
+
 Input : Bam file from Sample/bismark
 
-Output : txt file
+Reads of the BAM file are streamed from samtools view (no intermediate SAM file).
+
+Output : txt file (dir_data/extract/distance_R1R2.txt)
 
 Distance
 -84
@@ -49,78 +59,189 @@ Distance
 1
 1
 
-"""
-
-# relative path of the main directory containing the data
-dir_data=argv[1]
-# ../test_FP_paired_end
-
-# relative path of the bam file
-bam_file=argv[2]
-# ../test_FP_paired_end/bismark/test_FP_paired_end_R1_val_1.fq_bismark_pe.bam
-
-# name of the bam file
-bam_file_name = os.path.basename(bam_file)
-
-# change file name suffix from .bam to .sam (file name only)
-pattern4 = re.search(".bam$",bam_file_name)
-if pattern4:
-	sam_file = re.sub(".bam",".sam",bam_file_name)
-
-
-# os.path.abspath(bam_file) = absolute path of the bam file
-
-# absolute directory name of the .bam file
-dir_name_file = os.path.dirname(os.path.abspath(bam_file))
-
-
-pattern = re.search(".bam$",bam_file_name)
-if pattern:
-
-	cmd = os.environ['SAMTOOLS_EXECUTE']+ ' view ' + '-h -o ' + dir_name_file + '/' + sam_file + ' ' + os.path.abspath(bam_file)
-	os.system(cmd)
-
-else:
-	print "No bam file in the data directory"
-	sys.exit(1)
+--histogram : do not write one line per read. Distances are counted in memory and written in
+	dir_data/extract/distance_R1R2_histogram.txt (Distance, Count) and
+	dir_data/extract/distance_R1R2_summary.txt (number of reads and quantiles of distance).
+--jobs N : with --histogram, count distances of each chromosome in N parallel processes.
+	The BAM file should be sorted by coordinates and indexed (samtools index).
 
+"""
 
-
-ifh = open(dir_name_file + '/' + sam_file)
-
-
-try:
-	ofh = open(dir_data + "/extract/distance_R1R2.txt", "w")   
-
-except IOError:
-	sys.exit(1)
-
-ofh.write("Distance\n")
-
-while 1:
-	line = ifh.readline()
-	if not line:
-		break
-
-	if line.startswith('@'):
-		continue
-
-	line = line.rstrip('\n\r')
-
-	elmts = line.split('\t')
-
-	read=elmts[0]
-	chr1=elmts[2]
-	start1 = int(elmts[3])
-	chr2=elmts[6]
-	start2 = int(elmts[7])
-
-	if chr2 != "=" and chr1 != chr2:
-		continue
-	dist = start2-start1
-	ofh.write(str(dist)+"\n")
-
-
-ifh.close()
-ofh.close()
-
+#Quantiles written in the summary file : (label, probability)
+quantiles = [
+	("Min.", 0),
+	("5%", 0.05),
+	("1st Qu.", 0.25),
+	("Median", 0.5),
+	("3rd Qu.", 0.75),
+	("95%", 0.95),
+	("Max.", 1),
+]
+
+def open_samtools_view(bam_file, region=None) :
+	cmd = [os.environ['SAMTOOLS_EXECUTE'], 'view', bam_file]
+	if region is not None:
+		cmd.append(region)
+	try:
+		process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1<<20)
+	except OSError as exc:
+		sys.exit("Cannot run '{0}' : {1}".format(" ".join(cmd), exc))
+	return process
+
+def close_samtools_view(process) :
+	process.stdout.close()
+	if process.wait() != 0:
+		sys.exit("samtools view failed (exit code {0}).".format(process.returncode))
+
+def get_distances(ifh) :
+	"""
+	yield distance between R1 and R2 for each read whose mate is on the same chromosome
+	"""
+	for line in ifh:
+		if line.startswith('@'):
+			continue
+
+		elmts = line.split('\t', 8)
+
+		chr1=elmts[2]
+		chr2=elmts[6]
+
+		if chr2 != "=" and chr1 != chr2:
+			continue
+		yield int(elmts[7])-int(elmts[3])
+
+def count_distances(bam_file, region=None) :
+	"""
+	Return the histogram of distances : distance => number of reads
+	"""
+	histogram = {}
+	process = open_samtools_view(bam_file, region)
+	for dist in get_distances(process.stdout):
+		histogram[dist] = histogram.get(dist, 0) + 1
+	close_samtools_view(process)
+	return histogram
+
+def count_region_distances(region) :
+	"""
+	Worker : histogram of distances for one chromosome (or '*' for unmapped reads without position)
+	"""
+	bam_file, chromosome = region
+	return count_distances(bam_file, chromosome)
+
+def get_chromosomes(bam_file) :
+	if not (os.path.exists(bam_file + '.bai') or os.path.exists(re.sub("\.bam$",".bai",bam_file))):
+		sys.exit("No index found for '{0}'. Split per chromosome needs a BAM file sorted by coordinates and indexed (samtools index).".format(bam_file))
+
+	cmd = [os.environ['SAMTOOLS_EXECUTE'], 'idxstats', bam_file]
+	process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+	chromosomes = []
+	for line in process.stdout:
+		# chromosome, length, # mapped reads, # unmapped reads
+		# '*' holds unmapped reads without position : samtools view reads them as region '*',
+		# so that they are counted as in a single pass over the BAM file
+		elmts = line.rstrip('\n\r').split('\t')
+		if int(elmts[2]) + int(elmts[3]) != 0:
+			chromosomes.append(elmts[0])
+	if process.wait() != 0:
+		sys.exit("samtools idxstats failed (exit code {0}).".format(process.returncode))
+	return chromosomes
+
+def count_distances_parallel(bam_file, nb_jobs) :
+	histogram = {}
+	pool = multiprocessing.Pool(nb_jobs)
+	regions = [(bam_file, chromosome) for chromosome in get_chromosomes(bam_file)]
+	for chromosome_histogram in pool.imap_unordered(count_region_distances, regions):
+		for dist, nb in chromosome_histogram.iteritems():
+			histogram[dist] = histogram.get(dist, 0) + nb
+	pool.close()
+	pool.join()
+	return histogram
+
+def write_distances(bam_file, output_file) :
+	try:
+		ofh = open(output_file, "w")
+	except IOError:
+		sys.exit(1)
+
+	ofh.write("Distance\n")
+
+	process = open_samtools_view(bam_file)
+	lines = []
+	for dist in get_distances(process.stdout):
+		lines.append(str(dist)+"\n")
+		if len(lines) == 100000:
+			ofh.write(''.join(lines))
+			lines = []
+	ofh.write(''.join(lines))
+	close_samtools_view(process)
+
+	ofh.close()
+
+def write_histogram(histogram, histogram_file, summary_file) :
+	histogram = sorted(histogram.items())
+
+	ofh = open(histogram_file, "w")
+	ofh.write("Distance\tCount\n")
+	for dist, nb in histogram:
+		ofh.write(str(dist) + "\t" + str(nb) + "\n")
+	ofh.close()
+
+	absolute_histogram = {}
+	for dist, nb in histogram:
+		absolute_histogram[abs(dist)] = absolute_histogram.get(abs(dist), 0) + nb
+	absolute_histogram = sorted(absolute_histogram.items())
+
+	nb_reads = sum([nb for dist, nb in histogram])
+	ofh = open(summary_file, "w")
+	ofh.write("Statistic\tDistance\tAbsolute distance\n")
+	ofh.write("Number of reads\t" + str(nb_reads) + "\t" + str(nb_reads) + "\n")
+	if nb_reads != 0:
+		for label, probability in quantiles:
+			ofh.write(label + "\t" + str(quantile(histogram, nb_reads, probability)) + "\t" + str(quantile(absolute_histogram, nb_reads, probability)) + "\n")
+		ofh.write("Mean\t" + str(round(sum([dist*nb for dist, nb in histogram])/float(nb_reads), 2)) + "\t" + str(round(sum([dist*nb for dist, nb in absolute_histogram])/float(nb_reads), 2)) + "\n")
+	ofh.close()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	# relative path of the main directory containing the data
+	# ../test_FP_paired_end
+	parser.add_argument("dir_data",help="sample directory")
+	# relative path of the bam file
+	# ../test_FP_paired_end/bismark/test_FP_paired_end_R1_val_1.fq_bismark_pe.bam
+	parser.add_argument("bam_file",help="BAM file produced by bismark")
+	parser.add_argument("--histogram",action="store_true",help="write the histogram and quantiles of distances instead of one line per read")
+	parser.add_argument("--jobs",type=int,default=1,help="with --histogram, number of chromosomes processed in parallel (needs an indexed BAM file)")
+	args=parser.parse_args()
+
+	dir_data = args.dir_data
+	bam_file = args.bam_file
+
+	if args.jobs < 1:
+		parser.print_help()
+		print "-----------\n"
+		sys.exit("Number of jobs should be a positive integer. Received {0}.".format(args.jobs))
+
+	if args.jobs > 1 and not args.histogram:
+		parser.print_help()
+		print "-----------\n"
+		sys.exit("--jobs can only be used with --histogram.")
+
+	# name of the bam file
+	bam_file_name = os.path.basename(bam_file)
+
+	pattern = re.search(".bam$",bam_file_name)
+	if not pattern:
+		print "No bam file in the data directory"
+		sys.exit(1)
+
+	bam_file = os.path.abspath(bam_file)
+
+	if not args.histogram:
+		write_distances(bam_file, dir_data + "/extract/distance_R1R2.txt")
+	else:
+		if args.jobs == 1:
+			histogram = count_distances(bam_file)
+		else:
+			histogram = count_distances_parallel(bam_file, args.jobs)
+		write_histogram(histogram, dir_data + "/extract/distance_R1R2_histogram.txt", dir_data + "/extract/distance_R1R2_summary.txt")
@@ -0,0 +1,242 @@
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Quality control statistics computed by parse_extract.py while results are written
+
+For each position written, the pair (coverage, # methylated) is counted per
+chromosome. Every statistic of the report is derived from these counts :
+	coverage summary and histogram
+	average methylation, % of hypo/intermediate/hyper methylated positions and
+	histogram of % methylation for each coverage filter
+	number of positions per chromosome passing each coverage filter
+	distribution of the distance between consecutive positions for some coverage filters
+This avoids reading synthese files again to compute them (see quality_control.R).
+"""
+
+import json
+import re
+
+#Coverage filters of the report : (label, minimum coverage, maximum coverage or None)
+COVERAGE_FILTERS=[
+	("no filter",1,None),
+	("coverage>=5",5,None),
+	("coverage in [5;500]",5,500),
+	("coverage>=10",10,None),
+	("coverage in [10;500]",10,500),
+	("coverage>500",501,None),
+]
+
+#Filters for which distances between consecutive positions of main chromosomes are counted
+INTERVAL_FILTERS=COVERAGE_FILTERS[1:5]
+INTERVAL_MIN_COVERAGE=min([minimum for label,minimum,maximum in INTERVAL_FILTERS])
+MAIN_CHROMOSOME=re.compile("^(chr)?[0-9XY]*$")
+
+#Methylation ratios (methylated/coverage) at or below HYPO are hypomethylated, at or above HYPER are hypermethylated
+HYPO=0.2
+HYPER=0.8
+
+def in_filter(coverage,minimum,maximum) :
+	return coverage >= minimum and (maximum is None or coverage <= maximum)
+
+def percent(value,total) :
+	if total == 0 :
+		return 0
+	return round(value*100.0/total,1)
+
+def quantile(histogram,nb_values,probability) :
+	"""
+	Quantile of values given as a sorted list of (value, count),
+	interpolated as the default quantile of R (type 7)
+	"""
+	h=(nb_values-1)*probability
+	rank=int(h)
+	low=high=None
+	seen=0
+	for value,count in histogram :
+		seen+=count
+		if low is None and seen > rank :
+			low=value
+		if seen > rank+1 :
+			high=value
+			break
+	if high is None :
+		high=low
+	return low+(h-rank)*(high-low)
+
+def get_histogram_report(counts) :
+	"""
+	Histogram and summary (as summary() of R) of values given as {value : count}
+	"""
+	histogram=sorted(counts.items())
+	nb_values=sum(counts.values())
+	report={"histogram":[list(values) for values in histogram]}
+	if nb_values != 0 :
+		report["summary"]={
+			"Min.":histogram[0][0],
+			"1st Qu.":quantile(histogram,nb_values,0.25),
+			"Median":quantile(histogram,nb_values,0.5),
+			"Mean":round(sum([value*nb for value,nb in histogram])/float(nb_values),2),
+			"3rd Qu.":quantile(histogram,nb_values,0.75),
+			"Max.":histogram[-1][0],
+		}
+	return report
+
+class Methylation_stats :
+
+	def __init__(self,context) :
+		self.context=context
+		#chromosome => {(coverage, # methylated) : number of positions}
+		self.counts={}
+		self.chromosomes=[]
+		#Strand merge of CpG positions (see merge_strands in parse_extract.py)
+		self.strands={"positions read":0,"merged on both strands":0,"single strand":0,"dropped":0}
+		#One {distance : number of intervals} per interval filter
+		self.intervals=[{} for values in INTERVAL_FILTERS]
+		#Last position of the current chromosome passing each interval filter (None if chromosome is not a main one)
+		self.last_positions=None
+
+	def get_counts(self,chromosome) :
+		"""
+		Dictionary to update with the positions written for chromosome
+		"""
+		if chromosome not in self.counts :
+			self.counts[chromosome]={}
+			self.chromosomes.append(chromosome)
+		if MAIN_CHROMOSOME.match(str(chromosome)) :
+			self.last_positions=[None]*len(INTERVAL_FILTERS)
+		else :
+			self.last_positions=None
+		return self.counts[chromosome]
+
+	def add_interval(self,position,coverage) :
+		"""
+		Count distances to the previous position of the chromosome,
+		for a position with coverage>=INTERVAL_MIN_COVERAGE
+		"""
+		if self.last_positions is None :
+			return
+		for i in range(len(INTERVAL_FILTERS)) :
+			label,minimum,maximum=INTERVAL_FILTERS[i]
+			if not in_filter(coverage,minimum,maximum) :
+				continue
+			if self.last_positions[i] is not None :
+				distance=position-self.last_positions[i]
+				self.intervals[i][distance]=self.intervals[i].get(distance,0)+1
+			self.last_positions[i]=position
+
+	def get_total_counts(self) :
+		total={}
+		for chromosome in self.chromosomes :
+			for key,nb in self.counts[chromosome].iteritems() :
+				total[key]=total.get(key,0)+nb
+		return total
+
+	def get_coverage_report(self,total) :
+		coverages={}
+		for (coverage,nb_methylated),nb in total.iteritems() :
+			coverages[coverage]=coverages.get(coverage,0)+nb
+		return get_histogram_report(coverages)
+
+	def get_filter_report(self,total,label,minimum,maximum) :
+		nb_positions=0
+		sum_ratio=0.0
+		nb_hypo=nb_hyper=0
+		#Number of positions per % of methylation (one bin per %, last bin for 100%)
+		histogram=[0]*101
+		for (coverage,nb_methylated),nb in total.iteritems() :
+			if not in_filter(coverage,minimum,maximum) :
+				continue
+			ratio=nb_methylated/float(coverage)
+			nb_positions+=nb
+			sum_ratio+=ratio*nb
+			if ratio <= HYPO :
+				nb_hypo+=nb
+			elif ratio >= HYPER :
+				nb_hyper+=nb
+			histogram[nb_methylated*100/coverage]+=nb
+		hypo=percent(nb_hypo,nb_positions)
+		hyper=percent(nb_hyper,nb_positions)
+		return {
+			"filter":label,
+			"positions":nb_positions,
+			"% of positions":percent(nb_positions,sum(total.values())),
+			"average methylation":percent(sum_ratio,nb_positions),
+			"% hypomethylated (<=20%)":hypo,
+			"% intermediate (]20;80[%)":round(100-(hypo+hyper),1),
+			"% hypermethylated (>=80%)":hyper,
+			"methylation histogram":histogram,
+		}
+
+	def get_chromosome_counts(self,chromosome) :
+		"""
+		Number of positions of chromosome in each coverage filter
+		"""
+		nb_positions=[0]*len(COVERAGE_FILTERS)
+		for (coverage,nb_methylated),nb in self.counts[chromosome].iteritems() :
+			for i in range(len(COVERAGE_FILTERS)) :
+				label,minimum,maximum=COVERAGE_FILTERS[i]
+				if in_filter(coverage,minimum,maximum) :
+					nb_positions[i]+=nb
+		return nb_positions
+
+	def write_report(self,json_file,tsv_file) :
+		total=self.get_total_counts()
+		report={
+			"context":self.context,
+			"positions":sum(total.values()),
+			"coverage":self.get_coverage_report(total),
+			"filters":[self.get_filter_report(total,*values) for values in COVERAGE_FILTERS],
+			"chromosomes":[],
+		}
+		if self.context == "CpG" :
+			report["strands"]=self.strands
+
+		ofh=open(tsv_file,"w")
+		ofh.write("Chromosome\t"+"\t".join(["# positions ("+values[0]+")" for values in COVERAGE_FILTERS])+"\n")
+		for chromosome in self.chromosomes :
+			nb_positions=self.get_chromosome_counts(chromosome)
+			ofh.write(str(chromosome)+"\t"+"\t".join([str(nb) for nb in nb_positions])+"\n")
+			chromosome_report={"chromosome":str(chromosome)}
+			for i in range(len(COVERAGE_FILTERS)) :
+				chromosome_report[COVERAGE_FILTERS[i][0]]=nb_positions[i]
+			report["chromosomes"].append(chromosome_report)
+		ofh.close()
+
+		report["intervals"]=[]
+		for i in range(len(INTERVAL_FILTERS)) :
+			interval_report=get_histogram_report(self.intervals[i])
+			interval_report["filter"]=INTERVAL_FILTERS[i][0]
+			report["intervals"].append(interval_report)
+
+		ofh=open(json_file,"w")
+		json.dump(report,ofh,indent=1,sort_keys=True)
+		ofh.write("\n")
+		ofh.close()
@@ -0,0 +1,397 @@
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Compact storage of methylation calls for parse_extract.py
+
+Each call read from a Bismark methylation extractor file is appended to a
+per-chromosome buffer as a single integer (position*2 + 1 if methylated).
+When a buffer is full, it is sorted and collapsed into a "run" made of three
+integer arrays :
+	positions	sorted positions
+	methylated	number of methylated calls (Z) at this position
+	unmethylated	number of unmethylated calls (z) at this position
+
+Runs of similar size are merged together so that the number of runs kept for
+a chromosome stays logarithmic with the number of calls read.
+
+When a memory cap is given, runs are spilled to temporary files before the
+memory of the table can exceed the cap. Spilled runs are read back block by
+block and k-way merged when positions of a chromosome are iterated. The cap
+covers the runs and buffers of calls held in memory, the copies made while
+they are sorted or merged, and the blocks read back from spill files : spill
+blocks are sized from the cap so that merging MAX_SPILLS files fits in it.
+"""
+
+import os
+import tempfile
+import heapq
+from array import array
+from itertools import izip
+
+#Number of calls buffered for a chromosome before being collapsed into a run
+BUFFER_SIZE=1<<20
+
+#Estimated memory used by a buffered call, by a call being sorted and by a position of a run (bytes)
+CALL_SIZE=8
+SORT_SIZE=32
+POSITION_SIZE=16
+
+#Number of positions written or read at once in spill files (at most)
+SPILL_BLOCK_SIZE=1<<15
+MIN_SPILL_BLOCK_SIZE=1<<10
+
+#Blocks of spill files being merged take 1/MERGE_SHARE of the memory cap
+MERGE_SHARE=4
+
+#Maximum number of spill files merged at once
+MAX_SPILLS=32
+
+def new_run() :
+	return (array('l'),array('I'),array('I'))
+
+def collapse_calls(calls) :
+	"""
+	Convert a list of encoded calls into a run (positions are unique and sorted)
+	"""
+	positions,methylated,unmethylated=new_run()
+	last_position=-1
+	nb_methylated=nb_unmethylated=0
+	for call in sorted(calls) :
+		position=call>>1
+		if position != last_position :
+			if last_position != -1 :
+				positions.append(last_position)
+				methylated.append(nb_methylated)
+				unmethylated.append(nb_unmethylated)
+			last_position=position
+			nb_methylated=nb_unmethylated=0
+		if call & 1 :
+			nb_methylated+=1
+		else :
+			nb_unmethylated+=1
+	if last_position != -1 :
+		positions.append(last_position)
+		methylated.append(nb_methylated)
+		unmethylated.append(nb_unmethylated)
+	return (positions,methylated,unmethylated)
+
+def merge_runs(run1,run2) :
+	"""
+	Merge two runs in a single linear pass, adding counts of common positions
+	"""
+	positions1,methylated1,unmethylated1=run1
+	positions2,methylated2,unmethylated2=run2
+	positions,methylated,unmethylated=new_run()
+	nb1=len(positions1)
+	nb2=len(positions2)
+	i=j=0
+	while i<nb1 and j<nb2 :
+		position1=positions1[i]
+		position2=positions2[j]
+		if position1 < position2 :
+			positions.append(position1)
+			methylated.append(methylated1[i])
+			unmethylated.append(unmethylated1[i])
+			i+=1
+		elif position2 < position1 :
+			positions.append(position2)
+			methylated.append(methylated2[j])
+			unmethylated.append(unmethylated2[j])
+			j+=1
+		else :
+			positions.append(position1)
+			methylated.append(methylated1[i]+methylated2[j])
+			unmethylated.append(unmethylated1[i]+unmethylated2[j])
+			i+=1
+			j+=1
+	if i<nb1 :
+		positions.extend(positions1[i:])
+		methylated.extend(methylated1[i:])
+		unmethylated.extend(unmethylated1[i:])
+	if j<nb2 :
+		positions.extend(positions2[j:])
+		methylated.extend(methylated2[j:])
+		unmethylated.extend(unmethylated2[j:])
+	return (positions,methylated,unmethylated)
+
+def sum_positions(positions) :
+	"""
+	Add counts of consecutive identical positions of a sorted iterator
+	"""
+	last_position=None
+	nb_methylated=nb_unmethylated=0
+	for position,methylated,unmethylated in positions :
+		if position != last_position :
+			if last_position is not None :
+				yield (last_position,nb_methylated,nb_unmethylated)
+			last_position=position
+			nb_methylated=nb_unmethylated=0
+		nb_methylated+=methylated
+		nb_unmethylated+=unmethylated
+	if last_position is not None :
+		yield (last_position,nb_methylated,nb_unmethylated)
+
+class Spill_file :
+	"""
+	Temporary file holding one sorted run per chromosome, written in blocks of
+	positions, # methylated and # unmethylated
+	"""
+
+	def __init__(self,tmp_dir,block_size=SPILL_BLOCK_SIZE,filename=None,index=None) :
+		#Blocks must be read with the size they were written with
+		self.block_size=block_size
+		if filename is not None :
+			#Spill file written by another process
+			self.filename=filename
+			self.fh=None
+			self.index=index
+			return
+		fd,self.filename=tempfile.mkstemp(prefix="parse_extract_",suffix=".tmp",dir=tmp_dir)
+		self.fh=os.fdopen(fd,"wb")
+		#chromosome => (offset, number of positions)
+		self.index={}
+
+	def write_positions(self,chromosome,positions) :
+		offset=self.fh.tell()
+		nb_positions=0
+		block=new_run()
+		for position,methylated,unmethylated in positions :
+			block[0].append(position)
+			block[1].append(methylated)
+			block[2].append(unmethylated)
+			if len(block[0]) == self.block_size :
+				nb_positions+=self.write_block(block)
+				block=new_run()
+		nb_positions+=self.write_block(block)
+		if nb_positions != 0 :
+			self.index[chromosome]=(offset,nb_positions)
+
+	def write_run(self,chromosome,run) :
+		offset=self.fh.tell()
+		nb_positions=len(run[0])
+		for start in range(0,nb_positions,self.block_size) :
+			end=start+self.block_size
+			self.write_block((run[0][start:end],run[1][start:end],run[2][start:end]))
+		if nb_positions != 0 :
+			self.index[chromosome]=(offset,nb_positions)
+
+	def write_block(self,block) :
+		for values in block :
+			values.tofile(self.fh)
+		return len(block[0])
+
+	def close_writing(self) :
+		self.fh.close()
+
+	def iter_positions(self,chromosome) :
+		if chromosome not in self.index :
+			return
+		offset,nb_positions=self.index[chromosome]
+		fh=open(self.filename,"rb")
+		fh.seek(offset)
+		while nb_positions != 0 :
+			nb=min(nb_positions,self.block_size)
+			positions,methylated,unmethylated=new_run()
+			positions.fromfile(fh,nb)
+			methylated.fromfile(fh,nb)
+			unmethylated.fromfile(fh,nb)
+			nb_positions-=nb
+			for values in izip(positions,methylated,unmethylated) :
+				yield values
+		fh.close()
+
+	def remove(self) :
+		os.remove(self.filename)
+
+class Methylation_table :
+
+	def __init__(self,buffer_size=BUFFER_SIZE,max_memory=None,tmp_dir=None) :
+		self.max_memory=max_memory
+		self.tmp_dir=tmp_dir
+		self.block_size=SPILL_BLOCK_SIZE
+		#Memory of runs and buffered calls above which they are spilled
+		self.run_memory=None
+		if max_memory is not None :
+			#1/MERGE_SHARE of the cap for the blocks read back and written when MAX_SPILLS+1 spill files are merged
+			self.block_size=min(SPILL_BLOCK_SIZE,max(MIN_SPILL_BLOCK_SIZE,max_memory/(MERGE_SHARE*(MAX_SPILLS+2)*POSITION_SIZE)))
+			#A buffer being sorted needs SORT_SIZE more bytes per call, then POSITION_SIZE per call for its run
+			buffer_size=min(buffer_size,max(1024,max_memory/(8*SORT_SIZE)))
+			#The rest for runs and buffered calls, which may take twice their size while runs are merged
+			merge_memory=(MAX_SPILLS+2)*self.block_size*POSITION_SIZE
+			self.run_memory=max(0,max_memory-merge_memory-buffer_size*(SORT_SIZE+POSITION_SIZE))/2
+		self.buffer_size=buffer_size
+		self.buffers={}
+		self.runs={}
+		self.spills=[]
+		self.nb_buffered=0
+		self.run_positions=0
+
+	def add_call(self,chromosome,position,is_methylated) :
+		if chromosome not in self.buffers :
+			self.buffers[chromosome]=array('l')
+			self.runs[chromosome]=[]
+		buffer=self.buffers[chromosome]
+		buffer.append((position<<1)|is_methylated)
+		if self.max_memory is not None :
+			self.nb_buffered+=1
+		if len(buffer) >= self.buffer_size :
+			self.flush(chromosome)
+		if self.max_memory is not None and self.nb_buffered*CALL_SIZE+self.run_positions*POSITION_SIZE > self.run_memory :
+			self.spill()
+
+	def flush(self,chromosome) :
+		buffer=self.buffers[chromosome]
+		if len(buffer) == 0 :
+			return
+		self.buffers[chromosome]=array('l')
+		if self.max_memory is not None :
+			self.nb_buffered-=len(buffer)
+		run=collapse_calls(buffer)
+		#buffer is released before runs are merged
+		del buffer
+		self.add_run(chromosome,run)
+
+	def add_run(self,chromosome,run) :
+		if chromosome not in self.runs :
+			self.buffers[chromosome]=array('l')
+			self.runs[chromosome]=[]
+		runs=self.runs[chromosome]
+		runs.append(run)
+		self.run_positions+=len(run[0])
+		#Merge last runs while the previous one is not bigger than the new one
+		while len(runs)>=2 and len(runs[-2][0]) <= 2*len(runs[-1][0]) :
+			last_run=runs.pop()
+			self.run_positions-=len(runs[-1][0])+len(last_run[0])
+			runs[-1]=merge_runs(runs[-1],last_run)
+			self.run_positions+=len(runs[-1][0])
+		if self.max_memory is not None and self.nb_buffered*CALL_SIZE+self.run_positions*POSITION_SIZE > self.run_memory :
+			self.spill()
+
+	def spill(self) :
+		"""
+		Write every run held in memory into a new spill file
+		"""
+		spill=Spill_file(self.tmp_dir,self.block_size)
+		for chromosome in sorted(self.runs) :
+			runs=self.runs[chromosome]
+			if len(self.buffers[chromosome]) != 0 :
+				runs.append(collapse_calls(self.buffers[chromosome]))
+				self.buffers[chromosome]=array('l')
+			self.runs[chromosome]=[]
+			if len(runs) == 0 :
+				continue
+			run=runs.pop()
+			while len(runs) != 0 :
+				run=merge_runs(runs.pop(),run)
+			spill.write_run(chromosome,run)
+		spill.close_writing()
+		self.nb_buffered=0
+		self.run_positions=0
+		self.spills.append(spill)
+		if len(self.spills) > MAX_SPILLS :
+			self.merge_spills()
+
+	def merge_spills(self) :
+		"""
+		Replace spill files by a single one, chromosome by chromosome
+		"""
+		spill=Spill_file(self.tmp_dir,self.block_size)
+		for chromosome in sorted(self.runs) :
+			spill.write_positions(chromosome,
+				sum_positions(heapq.merge(*[old_spill.iter_positions(chromosome) for old_spill in self.spills]))
+			)
+		spill.close_writing()
+		for old_spill in self.spills :
+			old_spill.remove()
+		self.spills=[spill]
+
+	def detach_spills(self) :
+		"""
+		Spill every call held in memory and return the (filename, block size, index)
+		of spill files, which are no longer removed by this table
+		"""
+		self.spill()
+		spills=[(spill.filename,spill.block_size,spill.index) for spill in self.spills]
+		self.spills=[]
+		return spills
+
+	def add_spills(self,spills) :
+		"""
+		Take over spill files detached from another table
+		"""
+		for filename,block_size,index in spills :
+			for chromosome in index :
+				if chromosome not in self.runs :
+					self.buffers[chromosome]=array('l')
+					self.runs[chromosome]=[]
+			self.spills.append(Spill_file(self.tmp_dir,block_size,filename,index))
+		if len(self.spills) > MAX_SPILLS :
+			self.merge_spills()
+
+	def get_chromosomes(self) :
+		return sorted(self.runs)
+
+	def get_run(self,chromosome) :
+		"""
+		Return the single run holding every call read for this chromosome
+		(calls spilled on disk are not included)
+		"""
+		self.flush(chromosome)
+		runs=self.runs[chromosome]
+		if len(runs) == 0 :
+			return new_run()
+		while len(runs) >= 2 :
+			last_run=runs.pop()
+			runs[-1]=merge_runs(runs[-1],last_run)
+		return runs[0]
+
+	def iter_positions(self,chromosome) :
+		"""
+		Iterate over (position, # methylated, # unmethylated) sorted by position
+		"""
+		positions,methylated,unmethylated=self.get_run(chromosome)
+		if len(self.spills) == 0 :
+			return izip(positions,methylated,unmethylated)
+		sources=[spill.iter_positions(chromosome) for spill in self.spills]
+		sources.append(izip(positions,methylated,unmethylated))
+		return sum_positions(heapq.merge(*sources))
+
+	def release(self,chromosome) :
+		del self.buffers[chromosome]
+		del self.runs[chromosome]
+
+	def close(self) :
+		"""
+		Remove spill files
+		"""
+		for spill in self.spills :
+			spill.remove()
+		self.spills=[]
@@ -30,9 +30,29 @@
 
 """
 Usage:
-./parse_extract.py sample_directory
-
-input : output from Bismark methylation extractor 
+./parse_extract.py [--contexts LIST] [--thresholds LIST] [--input FILE] [--jobs N] [--max-memory SIZE [--tmp-dir DIR]] sample_directory
+
+--contexts LIST : comma separated list of contexts to summarise among CpG, CHG and CHH (default CpG).
+	CHG and CHH calls are read from CHG_context / CHH_context files or from the
+	Non_CpG_context file written with --merge_non_CpG. A file shared by several
+	contexts is read only once.
+
+--thresholds LIST : comma separated list of coverage thresholds (default 5,10).
+	One coverage_<threshold>.bedGraph file is written for each of them.
+
+--input FILE : extractor file to read instead of the one found in sample_directory/extract.
+	Use '-' to read it from standard input (e.g. piped from zcat or from the extractor).
+--jobs N : number of processes used to read the extractor file (default 1)
+--max-memory SIZE : memory cap (e.g. 2G). Before the cap is reached, sorted counts
+	are spilled to temporary files (in DIR, default sample_directory/extract) and
+	merged back when results are written. The cap covers the counts held in memory,
+	the buffers used to sort and merge them, the blocks read back from temporary files
+	and the blocks of lines sent to the reading processes : only the fixed baseline of
+	the interpreter (about 12M per process, whatever the size of the input) is outside it.
+	With --jobs N, the cap is shared between the main process and the N reading
+	processes, which spill to DIR as well.
+
+input : output from Bismark methylation extractor (may be compressed with gzip or bzip2)
 Sample_X/extract/CpG_context_Sample_X_R1_val_1.fq_bismark_pe.txt
 HWI-D00629:44:C6KV1ANXX:1:1101:1465:1913_1:N:0:AGGTAC   -       2       88462987        z
 
@@ -40,177 +60,622 @@ output : % of methylated cytosines for each cpg position
 Chromosome      Position        Coverage        # methylated    % methylated
 1       20108   4       4       100
 
+For CpG context, results are written in synthese_CpG.txt and coverage_<threshold>.bedGraph.
+For CHG and CHH contexts, results are written in synthese_<context>.txt and
+coverage_<threshold>_<context>.bedGraph. Calls on both strands of a CpG are merged, other contexts are
+reported cytosine by cytosine.
+
+Quality control statistics (coverage and methylation distributions for several coverage
+filters, strand merge counts, number of positions per chromosome and distances between
+covered positions) are computed while results are written, in qc_report_<context>.json
+and qc_chromosomes_<context>.tsv. quality_control.R reads them to draw the quality controls.
+
 """
 
 from string import *
 from sys import argv
+import sys
 import re
 import os
 from os import getcwd
+import argparse
+import multiprocessing
+import subprocess
+import gzip
+import bz2
+from collections import deque
+
+from methylation_table import Methylation_table, BUFFER_SIZE
+from methylation_stats import Methylation_stats, INTERVAL_MIN_COVERAGE
 
 ########################
 debug=0
 ########################
 
-dir_data=argv[1]
-
-fastq_dir = dir_data + '/trim_galore/'
-
-for fastq_file in os.listdir(fastq_dir):
-	pattern = re.search("_R1_trimmed.fq(.gz)?",fastq_file)
-	pattern2 = re.search("_R1_val_1.fq(.gz)?",fastq_file)
-	if pattern:
-		fastq_file_se = fastq_file
-		file_cpg_single_end = dir_data +  '/extract/' + 'CpG_context_' + fastq_file_se + '_bismark.txt'
+#Extractor files may be compressed
+compression_suffixes=['', '.gz', '.bz2']
+
+#Number of lines sent at once to a process when the extractor file is streamed
+BLOCK_SIZE=100000
+
+#Estimated memory used by a line of a block and its counts, in the main process or in the process parsing it (bytes)
+LINE_SIZE=256
+
+#Default coverage thresholds of bedGraph files
+BEDGRAPH_THRESHOLDS=[5,10]
+
+#Number of synthese lines written at once
+WRITE_BUFFER_SIZE=10000
+
+#Calls written by Bismark methylation extractor in each context : (methylated, unmethylated)
+context_calls = {
+	'CpG' : ('Z', 'z'),
+	'CHG' : ('X', 'x'),
+	'CHH' : ('H', 'h'),
+}
+contexts_order = ['CpG', 'CHG', 'CHH']
+
+def find_extractor_file(dir_data, prefixes, name) :
+	for prefix in prefixes:
+		for suffix in compression_suffixes:
+			if os.path.exists(dir_data + '/extract/' + prefix + name + suffix):
+				return dir_data + '/extract/' + prefix + name + suffix
+	return None
+
+def get_extractor_file(dir_data, context='CpG') :
+	fastq_dir = dir_data + '/trim_galore/'
+
+	if context == 'CpG':
+		prefixes = ['CpG_context_']
+	else:
+		#With --merge_non_CpG, CHG and CHH calls are written in a single file
+		prefixes = [context + '_context_', 'Non_CpG_context_']
+
+	file_cpg = None
+	for fastq_file in os.listdir(fastq_dir):
+		pattern = re.search("_R1_trimmed.fq(.gz)?",fastq_file)
+		pattern2 = re.search("_R1_val_1.fq(.gz)?",fastq_file)
+		if pattern:
+			fastq_file_se = fastq_file
+			file_cpg_single_end = find_extractor_file(dir_data, prefixes, fastq_file_se + '_bismark.txt')
+			
+			if file_cpg_single_end is not None:
+				#print 'ok single end'
+				file_cpg = file_cpg_single_end
+
+
+		elif pattern2:
+			fastq_file_pe = fastq_file
+			file_cpg_paired_end = find_extractor_file(dir_data, prefixes, fastq_file_pe + '_bismark_pe.txt')
+
+			if file_cpg_paired_end is not None:
+				#print 'ok paired end'
+				file_cpg = file_cpg_paired_end
+
+	return file_cpg
+
+
+def get_extractor_files(dir_data, contexts) :
+	"""
+	Return the list of (extractor file, contexts read from this file)
+	"""
+	files = []
+	file2contexts = {}
+	for context in contexts:
+		file_cpg = get_extractor_file(dir_data, context)
+		if file_cpg is None:
+			sys.exit("No {0}_context extractor file found in '{1}/extract'.".format(context, dir_data))
+		if file_cpg not in file2contexts:
+			file2contexts[file_cpg] = []
+			files.append(file_cpg)
+		file2contexts[file_cpg].append(context)
+	return [(file_cpg, file2contexts[file_cpg]) for file_cpg in files]
+
+
+def new_tables(contexts, buffer_size=BUFFER_SIZE, max_memory=None, tmp_dir=None) :
+	"""
+	One table of counts per context, sharing the memory cap
+	"""
+	if max_memory is not None:
+		max_memory = max_memory/len(contexts)
+	tables = {}
+	for context in contexts:
+		tables[context] = Methylation_table(buffer_size, max_memory, tmp_dir)
+	return tables
+
+
+def parse_calls(lines, tables) :
+	# chromosome names as found in extractor file => chromosome used as key
+	chromosome_keys = {}
+
+	# call => (table of its context, 1 if methylated)
+	calls = {}
+	for context in tables:
+		methylated_call, unmethylated_call = context_calls[context]
+		calls[methylated_call] = (tables[context], 1)
+		calls[unmethylated_call] = (tables[context], 0)
+
+	noLine=1
+	for line in lines:
+
+		if line.startswith('Bismark methylation extractor'):
+			continue
 		
-		if os.path.exists(file_cpg_single_end):
-			#print 'ok single end'
-			file_cpg = file_cpg_single_end
-
-
-	elif pattern2:
-		fastq_file_pe = fastq_file
-		file_cpg_paired_end = dir_data +  '/extract/' + 'CpG_context_' + fastq_file_pe + '_bismark_pe.txt'
-
-		if os.path.exists(file_cpg_paired_end):
-			#print 'ok paired end'
-			file_cpg = file_cpg_paired_end
-
-
-
-open_file_cpg = open(file_cpg)
-	
-cpg_context = {}
-
-noLine=1
-for line in open_file_cpg:
-
-	if line.startswith('Bismark methylation extractor'):
-		continue
-	
-	noLine=noLine+1
-	if debug==1 and noLine>100000:
-		break
-
-	line = line.rstrip('\n\r')
-	elmts = line.split()
-	# ['HWI-D00629:44:C6KV1ANXX:1:1101:6022:3658_1:N:0:AGGTAC', '-', '9', '29828', 'x']
-	read , sens , chromosome , cpg_position , cpg_call = elmts
-	
-	if chromosome.startswith('chr'):
-		search_chr = re.search('chr(.*)',chromosome)
-		chromosome = search_chr.group(1)
-
-	if re.match("^[0-9]", chromosome):
-		chromosome = int(chromosome)
-
-	cpg_position = int(cpg_position)
-
-# data are added in a dictionnary :
-# cpg_context[chromosome][CpGPosition][contexte]
-
-	if not chromosome in cpg_context:
-		cpg_context[chromosome] = {}
-
-	if not cpg_position in cpg_context[chromosome]:
-		cpg_context[chromosome][cpg_position] = {}
-	if not cpg_call in cpg_context[chromosome][cpg_position]:
-		cpg_context[chromosome][cpg_position][cpg_call] = 0
-
-	cpg_context[chromosome][cpg_position][cpg_call]+=1
-	
-
-open_file_cpg.close()
-
-
-# data processing #
+		noLine=noLine+1
+		if debug==1 and noLine>100000:
+			break
 
-methylations = {}
+		elmts = line.split()
+		# ['HWI-D00629:44:C6KV1ANXX:1:1101:6022:3658_1:N:0:AGGTAC', '-', '9', '29828', 'x']
+		read , sens , chromosome , cpg_position , cpg_call = elmts
 
-for chromosome in cpg_context:
-	for cpg_position in cpg_context[chromosome]:
-
-		cpg_call = 'Z'
-		cpg_call_lett_min = lower(cpg_call)
-		nb_Z = 0
-		nb_z = 0
-		if cpg_call in cpg_context[chromosome][cpg_position]:
-			if cpg_call_lett_min in cpg_context[chromosome][cpg_position]:
-				nb_Z = cpg_context[chromosome][cpg_position][cpg_call]
-				nb_z = cpg_context[chromosome][cpg_position][cpg_call_lett_min]
-			else :
-				# only reads in context 'Z'
-				nb_Z = cpg_context[chromosome][cpg_position][cpg_call]
+		if cpg_call in calls:
+			table, is_methylated = calls[cpg_call]
 		else:
-			if cpg_call_lett_min in cpg_context[chromosome][cpg_position]:
-			# only reads in context 'h'
-				nb_z = cpg_context[chromosome][cpg_position][cpg_call_lett_min]
-
-		if nb_Z != 0 or nb_z != 0 :
-			if not chromosome in methylations:
-				methylations[chromosome] = {}
-			if not cpg_position in methylations[chromosome]:
-				methylations[chromosome][int(cpg_position)] = {}	
-			methylation_coverage = nb_Z + nb_z
-			methylations[chromosome][int(cpg_position)] = (methylation_coverage , nb_Z)
-
-
-
-
-#Filter for consecutive positions
-toSkip= {} 
-for chromosome in sorted(methylations):
-	for cpgPosition in sorted(methylations[chromosome]):
-		#print "cpgPosition="+str(cpgPosition)
-		if (int(cpgPosition)+1) in methylations[chromosome]:
-			#print ""+str(cpgPosition)+" consecutive"
-			methylation_coverage1 , nb_Z1 = methylations[chromosome][int(cpgPosition)]
-			methylation_coverage2 , nb_Z2 = methylations[chromosome][int(cpgPosition+1)]
-			methylations[chromosome][int(cpgPosition)]=(methylation_coverage1+methylation_coverage2, nb_Z1+nb_Z2)
-			if not chromosome in toSkip:
-				toSkip[chromosome] = {}
-			toSkip[chromosome][cpgPosition+1]=1
-	
-
-
-# Sorting and display of the results
-context = 'Z'
-
-output_path = dir_data +  '/extract/' 
-ofh  = open(output_path + "synthese_CpG.txt", "w") 
-
-ofh_BED10  = open(output_path +'coverage_10.bedGraph','w')
-
-ofh_BED5  = open(output_path +'coverage_5.bedGraph','w')
-
-ofh.write('Chromosome' + '\t'+ 'Position' + '\t' +  'Coverage'     + '\t' +   '# methylated' + '\t' + '% methylated' + '\n')
+			continue
 
-
-for chromosome in sorted(methylations):
-	for cpgPosition in sorted(methylations[chromosome]):
-			
-			if toSkip and chromosome in toSkip and cpgPosition in toSkip[chromosome]:
-				#print 'consecutive positions at ',chromosome,":",cpgPosition
-				continue
-			meth = methylations[chromosome][int(cpgPosition)]
-			methylation_coverage , nb_Z = meth
-			methylation_percent = round(nb_Z / float(methylation_coverage)*100,1)
-			methylation_percent = str(methylation_percent)
-			pattern4 = re.search("\.0$",methylation_percent)
-			if pattern4:
-				methylation_percent = re.sub("\.0","",methylation_percent)
-			
-
-			ofh.write(str(chromosome) + '\t' + str(cpgPosition) + '\t' + str(methylation_coverage) + '\t' + str(nb_Z) + '\t' + methylation_percent + '\n')
-			if methylation_coverage >= 5:
-
-				ofh_BED5.write( str(chromosome) + '\t' + str(cpgPosition) + '\t' +  str(cpgPosition+1) + '\t' + str(float(methylation_percent)/100) + '\n')
-
-			if methylation_coverage >= 10:
-				ofh_BED10.write( str(chromosome) + '\t' + str(cpgPosition) + '\t' +  str(cpgPosition+1) + '\t' + str(float(methylation_percent)/100) + '\n')
-
-
-
-ofh.close()
-ofh_BED5.close()
-ofh_BED10.close()
+		if chromosome in chromosome_keys:
+			chromosome = chromosome_keys[chromosome]
+		else:
+			chromosome_name = chromosome
+			if chromosome.startswith('chr'):
+				search_chr = re.search('chr(.*)',chromosome)
+				chromosome = search_chr.group(1)
+
+			if re.match("^[0-9]", chromosome):
+				chromosome = int(chromosome)
+			chromosome_keys[chromosome_name] = chromosome
+
+		# data are added in a compact table :
+		# one integer array per chromosome
+		table.add_call(chromosome, int(cpg_position), is_methylated)
+
+
+def is_streamed(file_cpg) :
+	return file_cpg == '-' or file_cpg.endswith('.gz') or file_cpg.endswith('.bz2')
+
+
+def open_extractor_file(file_cpg) :
+	"""
+	Return (file handle, decompression process or None).
+	Compressed files are inflated by a gzip/bzip2 child process so that
+	decompression runs alongside parsing.
+	"""
+	if file_cpg == '-':
+		return sys.stdin, None
+
+	if file_cpg.endswith('.gz'):
+		command = ['gzip', '-dc', file_cpg]
+	elif file_cpg.endswith('.bz2'):
+		command = ['bzip2', '-dc', file_cpg]
+	else:
+		return open(file_cpg), None
+
+	if not os.path.exists(file_cpg):
+		raise IOError("No such file : '{0}'".format(file_cpg))
+	try:
+		process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=1<<20)
+		return process.stdout, process
+	except OSError:
+		# no gzip/bzip2 executable : decompress in this process
+		if file_cpg.endswith('.gz'):
+			return gzip.open(file_cpg), None
+		else:
+			return bz2.BZ2File(file_cpg), None
+
+
+def close_extractor_file(file_cpg, open_file_cpg, process) :
+	if open_file_cpg is not sys.stdin:
+		open_file_cpg.close()
+	if process is not None:
+		process.wait()
+		# a negative code means process has been stopped by a signal (e.g. SIGPIPE in debug mode)
+		if process.returncode > 0:
+			sys.exit("Decompression of '{0}' failed (exit code {1}).".format(file_cpg, process.returncode))
+
+
+def read_extractor_file(file_cpg, tables) :
+	open_file_cpg, process = open_extractor_file(file_cpg)
+	parse_calls(open_file_cpg, tables)
+	close_extractor_file(file_cpg, open_file_cpg, process)
+
+
+def get_chunks(file_cpg, nb_chunks, contexts, buffer_size=BUFFER_SIZE, max_memory=None, tmp_dir=None) :
+	"""
+	Split extractor file into byte ranges [start;end[ aligned on line ends
+	"""
+	file_size = os.path.getsize(file_cpg)
+	open_file_cpg = open(file_cpg)
+	chunks = []
+	start = 0
+	for idx in range(1,nb_chunks+1):
+		if idx == nb_chunks:
+			end = file_size
+		else:
+			end = max(start, file_size*idx/nb_chunks)
+			if end < file_size:
+				open_file_cpg.seek(end)
+				open_file_cpg.readline()
+				end = open_file_cpg.tell()
+		if end > start:
+			chunks.append((file_cpg, start, end, contexts, buffer_size, max_memory, tmp_dir))
+		start = end
+	open_file_cpg.close()
+	return chunks
+
+
+def read_chunk(chunk) :
+	"""
+	Worker : count calls of a byte range of the extractor file.
+	Return the counts of each context (see get_runs).
+	"""
+	file_cpg, start, end, contexts, buffer_size, max_memory, tmp_dir = chunk
+
+	open_file_cpg = open(file_cpg)
+	open_file_cpg.seek(start)
+	def lines():
+		position = start
+		while position < end:
+			line = open_file_cpg.readline()
+			if not line:
+				break
+			position += len(line)
+			yield line
+
+	tables = new_tables(contexts, buffer_size, max_memory, tmp_dir)
+	parse_calls(lines(), tables)
+	open_file_cpg.close()
+
+	#Under a memory cap, counts of a chunk are handed over in spill files : results waiting
+	#in the main process would not be bounded otherwise (counts of a block are bounded by its size)
+	return get_runs(tables, max_memory is not None)
+
+
+def read_block(block) :
+	"""
+	Worker : count calls of a block of lines of a streamed extractor file.
+	Return the counts of each context (see get_runs).
+	"""
+	lines, contexts, buffer_size, max_memory, tmp_dir = block
+
+	tables = new_tables(contexts, buffer_size, max_memory, tmp_dir)
+	parse_calls(lines.splitlines(), tables)
+
+	return get_runs(tables)
+
+
+def get_runs(tables, detach=False) :
+	"""
+	Return, per context, one run of (positions, # methylated, # unmethylated) per chromosome
+	and the spill files written when the table reached its memory cap (every count is
+	spilled if detach is set). Spill files are handed over to the main process, which removes them.
+	"""
+	runs = {}
+	for context in tables:
+		table = tables[context]
+		if detach or len(table.spills) != 0:
+			runs[context] = ({}, table.detach_spills())
+			continue
+		runs[context] = ({}, [])
+		for chromosome in table.get_chromosomes():
+			runs[context][0][chromosome] = table.get_run(chromosome)
+			table.release(chromosome)
+	return runs
+
+
+def get_blocks(open_file_cpg, contexts, buffer_size, block_size=BLOCK_SIZE, max_memory=None, tmp_dir=None) :
+	block = []
+	for line in open_file_cpg:
+		block.append(line)
+		if len(block) == block_size:
+			yield (''.join(block), contexts, buffer_size, max_memory, tmp_dir)
+			block = []
+	if len(block) != 0:
+		yield (''.join(block), contexts, buffer_size, max_memory, tmp_dir)
+
+
+def read_extractor_file_parallel(file_cpg, tables, pool, nb_jobs) :
+	"""
+	Count calls with the nb_jobs processes of pool, then reduce partial counts per context and chromosome
+	"""
+	contexts = sorted(tables)
+	buffer_size = min([tables[context].buffer_size for context in contexts])
+	#Each process gets the same memory cap as the tables of the main process
+	max_memory = tables[contexts[0]].max_memory
+	if max_memory is not None:
+		max_memory *= len(contexts)
+	tmp_dir = tables[contexts[0]].tmp_dir
+
+	if is_streamed(file_cpg):
+		#File cannot be split : blocks of lines are read here and parsed by the processes.
+		#Number of blocks waiting for a process is bounded to keep memory under control.
+		block_size = BLOCK_SIZE
+		worker_memory = max_memory
+		if max_memory is not None:
+			#Blocks waiting for a process take at most a quarter of the cap of the main process.
+			#A process parsing a block keeps the rest of its cap for its tables.
+			block_size = max(1000, min(BLOCK_SIZE, max_memory/(8*nb_jobs*LINE_SIZE)))
+			worker_memory = max_memory - block_size*LINE_SIZE
+		open_file_cpg, process = open_extractor_file(file_cpg)
+		pending = deque()
+		for block in get_blocks(open_file_cpg, contexts, buffer_size, block_size, worker_memory, tmp_dir):
+			pending.append(pool.apply_async(read_block, (block,)))
+			if len(pending) >= 2*nb_jobs:
+				add_runs(tables, pending.popleft().get())
+		while len(pending) != 0:
+			add_runs(tables, pending.popleft().get())
+		close_extractor_file(file_cpg, open_file_cpg, process)
+	else:
+		#Several chunks per process so that a slow chunk does not hold back the others
+		nb_chunks = nb_jobs*4
+		if max_memory is not None:
+			#Counts of a chunk take less than half of its size in bytes
+			nb_chunks = max(nb_chunks, os.path.getsize(file_cpg)/max_memory+1)
+		chunks = get_chunks(file_cpg, nb_chunks, contexts, buffer_size, max_memory, tmp_dir)
+
+		for runs in pool.imap_unordered(read_chunk, chunks):
+			add_runs(tables, runs)
+
+
+def add_runs(tables, runs) :
+	for context in runs:
+		context_runs, spills = runs[context]
+		for chromosome in context_runs:
+			tables[context].add_run(chromosome, context_runs[chromosome])
+		tables[context].add_spills(spills)
+
+
+def merge_strands(positions, strands=None) :
+	"""
+	Filter for consecutive positions : a CpG is called on both strands at
+	position and position+1. Counts of position+1 are added to position and
+	position+1 is skipped (as is any position following a called position).
+
+	positions : iterator of (position, # methylated, # unmethylated) sorted by position
+	strands : optional dictionary of Methylation_stats counting merged, single strand and dropped positions
+	yield (position, coverage, # methylated)
+	"""
+	nb_read = nb_merged = nb_single = 0
+	pending = None
+	last_position = -2
+	for cpgPosition , nb_Z , nb_z in positions:
+		nb_read += 1
+		methylation_coverage = nb_Z + nb_z
+		if pending is not None:
+			if cpgPosition == pending[0]+1:
+				nb_merged += 1
+				yield (pending[0], pending[1]+methylation_coverage, pending[2]+nb_Z)
+			else:
+				nb_single += 1
+				yield pending
+			pending = None
+		if cpgPosition != last_position+1:
+			pending = (cpgPosition, methylation_coverage, nb_Z)
+		last_position = cpgPosition
+	if pending is not None:
+		nb_single += 1
+		yield pending
+
+	if strands is not None:
+		strands["positions read"] += nb_read
+		strands["merged on both strands"] += nb_merged
+		strands["single strand"] += nb_single
+		strands["dropped"] += nb_read - 2*nb_merged - nb_single
+
+
+def single_strand(positions, strands=None) :
+	"""
+	positions : iterator of (position, # methylated, # unmethylated) sorted by position
+	yield (position, coverage, # methylated)
+	"""
+	for position , nb_methylated , nb_unmethylated in positions:
+		yield (position, nb_methylated + nb_unmethylated, nb_methylated)
+
+
+def get_bedgraph_file(output_path, context, threshold) :
+	if context == 'CpG':
+		return output_path + 'coverage_' + str(threshold) + '.bedGraph'
+	else:
+		return output_path + 'coverage_' + str(threshold) + '_' + context + '.bedGraph'
+
+
+def get_report_files(output_path, context) :
+	"""
+	Quality control report : (JSON file, per chromosome TSV file)
+	"""
+	return (output_path + 'qc_report_' + context + '.json', output_path + 'qc_chromosomes_' + context + '.tsv')
+
+
+def format_methylation(methylation_coverage, nb_Z) :
+	"""
+	Return the end of synthese and bedGraph records (coverage, # methylated, % methylated)
+	"""
+	methylation_percent = str(round(nb_Z / float(methylation_coverage)*100,1))
+	if methylation_percent.endswith('.0'):
+		methylation_percent = methylation_percent[:-2]
+	return ('\t' + str(methylation_coverage) + '\t' + str(nb_Z) + '\t' + methylation_percent + '\n',
+		'\t' + str(float(methylation_percent)/100) + '\n')
+
+
+def write_results(table, output_path, context='CpG', thresholds=BEDGRAPH_THRESHOLDS) :
+	stats = Methylation_stats(context)
+
+	ofh  = open(output_path + "synthese_" + context + ".txt", "w") 
+
+	# one bedGraph file per coverage threshold : [threshold, file, lines to write]
+	bedgraphs = []
+	for threshold in sorted(thresholds):
+		bedgraphs.append([threshold, open(get_bedgraph_file(output_path, context, threshold),'w'), []])
+
+	# only CpG are symmetric : calls on both strands are merged
+	if context == 'CpG':
+		get_positions = merge_strands
+	else:
+		get_positions = single_strand
+
+	ofh.write('Chromosome' + '\t'+ 'Position' + '\t' +  'Coverage'     + '\t' +   '# methylated' + '\t' + '% methylated' + '\n')
+
+	# (coverage, # methylated) => formatted records, computed once
+	formats = {}
+	lines = []
+	for chromosome in table.get_chromosomes():
+		counts = stats.get_counts(chromosome)
+		chromosome_name = str(chromosome) + '\t'
+		for cpgPosition , methylation_coverage , nb_Z in get_positions(table.iter_positions(chromosome), stats.strands):
+			key = (methylation_coverage, nb_Z)
+			counts[key] = counts.get(key, 0) + 1
+			if methylation_coverage >= INTERVAL_MIN_COVERAGE:
+				stats.add_interval(cpgPosition, methylation_coverage)
+			if key in formats:
+				synthese_format, bedgraph_format = formats[key]
+			else:
+				synthese_format, bedgraph_format = formats[key] = format_methylation(methylation_coverage, nb_Z)
+
+			position = chromosome_name + str(cpgPosition)
+			lines.append(position + synthese_format)
+			bedgraph_line = None
+			for bedgraph in bedgraphs:
+				if methylation_coverage < bedgraph[0]:
+					break
+				if bedgraph_line is None:
+					bedgraph_line = position + '\t' + str(cpgPosition+1) + bedgraph_format
+				bedgraph[2].append(bedgraph_line)
+
+			if len(lines) == WRITE_BUFFER_SIZE:
+				write_lines(ofh, lines, bedgraphs)
+				lines = []
+
+		# arrays of this chromosome are no longer needed
+		table.release(chromosome)
+
+	write_lines(ofh, lines, bedgraphs)
+	ofh.close()
+	for bedgraph in bedgraphs:
+		bedgraph[1].close()
+
+	json_file, tsv_file = get_report_files(output_path, context)
+	stats.write_report(json_file, tsv_file)
+
+
+def write_lines(ofh, lines, bedgraphs) :
+	ofh.write(''.join(lines))
+	for bedgraph in bedgraphs:
+		bedgraph[1].write(''.join(bedgraph[2]))
+		bedgraph[2] = []
+
+
+def process_sample(dir_data, nb_jobs=1, max_memory=None, tmp_dir=None, file_cpg=None, contexts=['CpG'], thresholds=BEDGRAPH_THRESHOLDS) :
+	"""
+	Summarise calls of each context. Return the list of extractor files read.
+	"""
+	if file_cpg is None:
+		files = get_extractor_files(dir_data, contexts)
+	else:
+		files = [(file_cpg, contexts)]
+
+	output_path = dir_data +  '/extract/' 
+	if tmp_dir is None:
+		tmp_dir = output_path
+
+	if max_memory is not None and nb_jobs > 1:
+		#Cap shared by the main process and the nb_jobs reading processes
+		max_memory /= nb_jobs+1
+	tables = new_tables(contexts, max_memory=max_memory, tmp_dir=tmp_dir)
+	pool = None
+	if nb_jobs > 1:
+		#A single pool of processes reads every file
+		pool = multiprocessing.Pool(nb_jobs)
+	try:
+		for file_cpg, file_contexts in files:
+			file_tables = {}
+			for context in file_contexts:
+				file_tables[context] = tables[context]
+			if pool is None:
+				read_extractor_file(file_cpg, file_tables)
+			else:
+				read_extractor_file_parallel(file_cpg, file_tables, pool, nb_jobs)
+
+		# Sorting and display of the results
+		for context in contexts:
+			write_results(tables[context], output_path, context, thresholds)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		for context in contexts:
+			tables[context].close()
+	return [file_cpg for file_cpg, file_contexts in files]
+
+
+def get_thresholds(value) :
+	"""
+	Interpret a comma separated list of coverage thresholds such as "3,5,10"
+	"""
+	thresholds = []
+	for threshold in value.split(','):
+		if not re.match("^ *[0-9]+ *$", threshold) or int(threshold) < 1:
+			sys.exit("Unexpected coverage threshold '{0}'. Expected a list of positive integers (e.g. 5,10).".format(threshold))
+		if int(threshold) not in thresholds:
+			thresholds.append(int(threshold))
+	return sorted(thresholds)
+
+
+def get_contexts(value) :
+	"""
+	Interpret a comma separated list of contexts such as "CpG,CHH"
+	"""
+	contexts = []
+	for context in value.split(','):
+		context = context.strip()
+		found = False
+		for known_context in contexts_order:
+			if context.lower() == known_context.lower():
+				found = True
+				if known_context not in contexts:
+					contexts.append(known_context)
+		if not found:
+			sys.exit("Unexpected context '{0}'. Expected a list among {1}.".format(context, ",".join(contexts_order)))
+	return contexts
+
+
+#Interpret a memory size such as "500M" or "64G"
+memory_regexpr=re.compile("^([0-9]+([.][0-9]+)?)([KkMmGgTt])?[Bb]?$")
+memory_units={"":1,"k":1<<10,"m":1<<20,"g":1<<30,"t":1<<40}
+
+def get_memory_value(parameter,value) :
+	me=memory_regexpr.match(value)
+	if me is None :
+		sys.exit("Cannot interpret memory size '{0}' given for {1} (expected e.g. '500M' or '64G').".format(value,parameter))
+	unit=me.group(3)
+	if unit is None :
+		unit=""
+	return int(float(me.group(1))*memory_units[unit.lower()])
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("sample_directory",help="sample directory containing trim_galore and extract directories")
+	parser.add_argument("--contexts",default="CpG",help="comma separated list of contexts among CpG,CHG,CHH (default CpG)")
+	parser.add_argument("--thresholds",default="5,10",help="comma separated list of coverage thresholds of bedGraph files (default 5,10)")
+	parser.add_argument("--input",help="extractor file to read (plain, .gz or .bz2), '-' for standard input")
+	parser.add_argument("--jobs",type=int,default=1,help="number of processes used to read the extractor file")
+	parser.add_argument("--max-memory",help="memory cap (e.g. 2G) besides the fixed baseline of the interpreter, counts are spilled to temporary files to stay under it")
+	parser.add_argument("--tmp-dir",help="directory for temporary files (default: sample_directory/extract)")
+	args=parser.parse_args()
+
+	if args.jobs < 1:
+		parser.print_help()
+		print "-----------\n"
+		sys.exit("Number of jobs should be a positive integer. Received {0}.".format(args.jobs))
+
+	max_memory = None
+	if args.max_memory is not None:
+		max_memory = get_memory_value("--max-memory",args.max_memory)
+
+	contexts = get_contexts(args.contexts)
+	thresholds = get_thresholds(args.thresholds)
+
+	try:
+		process_sample(args.sample_directory, args.jobs, max_memory, args.tmp_dir, args.input, contexts, thresholds)
+	except IOError as exc:
+		sys.exit("Cannot read extractor file : {0}".format(exc))
@@ -0,0 +1,157 @@
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Usage:
+./parse_extract_batch.py [--jobs N] [--max-memory SIZE [--sample-memory SIZE] [--tmp-dir DIR]] [--contexts LIST] [--thresholds LIST] [--summary FILE] sample_directory [sample_directory ...]
+
+Run parse_extract.py on several samples in a single command. Sample directories
+may be given as shell patterns (e.g. 'plate1/Sample_*'). Samples are dispatched
+on a pool of processes : its size is the lowest of the number of cores (or
+--jobs) and of --max-memory / --sample-memory.
+
+With --max-memory, each sample is processed under a memory cap of --sample-memory
+(see --max-memory of parse_extract.py) : counts of a deep sample are spilled to
+temporary files (in DIR, default sample_directory/extract) instead of going over
+its share of the batch memory.
+
+Each sample gets its own extract/synthese_CpG.txt and bedGraph files (and
+files of other --contexts), exactly as produced by parse_extract.py.
+
+output : run summary (default parse_extract_batch_summary.txt)
+Sample directory	Status	Duration (s)	Peak memory (MB)	Extractor file(s)
+Sample_1	OK	128.3	2140.5	Sample_1/extract/CpG_context_Sample_1_R1_val_1.fq_bismark_pe.txt
+
+"""
+
+import sys
+import os
+import glob
+import time
+import resource
+import argparse
+import multiprocessing
+
+from parse_extract import process_sample, get_memory_value, get_contexts, get_thresholds
+
+def run_sample(sample) :
+	"""
+	Worker : process one sample and report its duration and peak memory
+	"""
+	dir_data,sample_memory,tmp_dir,contexts,thresholds=sample
+	start_time=time.time()
+	status="OK"
+	file_cpg=""
+	try :
+		file_cpg=",".join(process_sample(dir_data,max_memory=sample_memory,tmp_dir=tmp_dir,contexts=contexts,thresholds=thresholds))
+	except SystemExit as exc :
+		status="FAILED : {0}".format(exc)
+	except Exception as exc :
+		status="FAILED : {0}".format(exc)
+	duration=time.time()-start_time
+	#ru_maxrss is given in kilobytes on Linux
+	peak_memory=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+	return (dir_data,status,duration,peak_memory,file_cpg)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("sample_directory",help="sample directories (or shell patterns) to process",nargs="+")
+	parser.add_argument("--jobs",type=int,default=multiprocessing.cpu_count(),help="maximum number of samples processed at the same time (default: number of cores)")
+	parser.add_argument("--max-memory",help="memory available for the whole batch (e.g. 64G)")
+	parser.add_argument("--sample-memory",default="4G",help="memory cap of one sample when --max-memory is given (default: 4G)")
+	parser.add_argument("--tmp-dir",help="directory for temporary files of samples (default: sample_directory/extract)")
+	parser.add_argument("--contexts",default="CpG",help="comma separated list of contexts among CpG,CHG,CHH (default CpG)")
+	parser.add_argument("--thresholds",default="5,10",help="comma separated list of coverage thresholds of bedGraph files (default 5,10)")
+	parser.add_argument("--summary",default="parse_extract_batch_summary.txt",help="pathname to the run summary file")
+	args=parser.parse_args()
+
+	samples=[]
+	for pattern in args.sample_directory :
+		dirs=sorted(glob.glob(pattern))
+		if len(dirs) == 0 :
+			sys.exit("No sample directory matching '{0}'.".format(pattern))
+		for dir_data in dirs :
+			dir_data=dir_data.rstrip("/")
+			if os.path.isdir(dir_data) and dir_data not in samples :
+				samples.append(dir_data)
+	if len(samples) == 0 :
+		sys.exit("No sample directory to process.")
+
+	if args.jobs < 1 :
+		parser.print_help()
+		print "-----------\n"
+		sys.exit("Number of jobs should be a positive integer. Received {0}.".format(args.jobs))
+	contexts=get_contexts(args.contexts)
+	thresholds=get_thresholds(args.thresholds)
+
+	if args.tmp_dir is not None and not os.path.isdir(args.tmp_dir) :
+		sys.exit("Temporary directory '{0}' does not exist.".format(args.tmp_dir))
+
+	nb_jobs=min(args.jobs,len(samples))
+	#Samples are processed without memory cap unless --max-memory is given
+	sample_memory=None
+	if args.max_memory is not None :
+		max_memory=get_memory_value("--max-memory",args.max_memory)
+		sample_memory=get_memory_value("--sample-memory",args.sample_memory)
+		nb_jobs=min(nb_jobs,max(1,max_memory/sample_memory))
+
+	print "---------------------------"
+	print "Number of samples :\t",len(samples)
+	print "Number of processes :\t",nb_jobs
+	print "Summary file :\t",args.summary
+	print "---------------------------"
+
+	try :
+		ofh=open(args.summary,"w")
+	except IOError as exc:
+		sys.exit("Cannot create summary file '{0}' : {1}".format(args.summary,exc))
+	ofh.write("Sample directory\tStatus\tDuration (s)\tPeak memory (MB)\tExtractor file(s)\n")
+
+	#One process per sample so that peak memory is measured sample by sample
+	pool=multiprocessing.Pool(nb_jobs,maxtasksperchild=1)
+	results={}
+	nb_failed=0
+	for result in pool.imap_unordered(run_sample,[(dir_data,sample_memory,args.tmp_dir,contexts,thresholds) for dir_data in samples]) :
+		dir_data,status,duration,peak_memory,file_cpg=result
+		print "{0} : {1} (duration: {2:.1f}s, peak memory: {3:.1f}MB)".format(dir_data,status,duration,peak_memory)
+		sys.stdout.flush()
+		if status != "OK" :
+			nb_failed+=1
+		results[dir_data]=result
+	pool.close()
+	pool.join()
+
+	for dir_data in samples :
+		dir_data,status,duration,peak_memory,file_cpg=results[dir_data]
+		ofh.write("{0}\t{1}\t{2:.1f}\t{3:.1f}\t{4}\n".format(dir_data,status,duration,peak_memory,file_cpg))
+	ofh.close()
+
+	if nb_failed != 0 :
+		sys.exit("{0} sample(s) out of {1} failed.".format(nb_failed,len(samples)))
@@ -62,6 +62,13 @@ then
     fi
 fi
 
+#Statistics are computed by parse_extract.py : synthese_CpG.txt is not read again
+if [ ! -f "$dir_data/extract/qc_report_CpG.json" ] || [ ! -f "$dir_data/extract/qc_chromosomes_CpG.tsv" ]
+then
+    echo "Quality control report of parse_extract.py not found in $dir_data/extract : run parse_extract.py first"
+    exit 1
+fi
+
 $R_EXECUTE CMD BATCH  --no-restore --no-save "--args $dir_data" $RRBS_PIPELINE_HOME/quality_control.R \
 	     $work_dir_qual/quality_control.Rout
 if [ $? -ne 0 ]
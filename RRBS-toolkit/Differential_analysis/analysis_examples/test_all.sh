@@ -1,6 +1,6 @@
 #!/bin/sh
 echo "Cleaning output directories ..."
-for dir in out_DMR_only out_methylKit out_methylSig out_nostats
+for dir in out_DMR_only out_methylKit out_methylSig out_nostats out_natural
 do
 	rm -rf $dir
 	mkdir $dir
@@ -17,3 +17,59 @@ do
 		echo "Failed !"
 	fi
 done
+
+#Compare results to the reference ones saved in out_*_bak directories
+#(log files and graphics are not compared)
+echo "Comparing results to reference ones ..."
+nb_differences=0
+for dir in out_DMR_only out_methylKit out_methylSig out_nostats
+do
+	for file in $dir/*.txt* $dir/*.bed*
+	do
+		[ -f "$file" ] || continue
+		ref=${dir}_bak/`basename "$file"`
+		if [ ! -f "$ref" ]
+		then
+			echo "No reference file for '$file'"
+		elif ! cmp -s "$file" "$ref"
+		then
+			echo "'$file' differs from '$ref'"
+			nb_differences=`expr $nb_differences + 1`
+		fi
+	done
+done
+#Obvious DMCs of samples sorted by chromosome in natural order (1, 2, 10, X) : positions of
+#chromosome 1 are split in 4 chromosomes, obvious DMCs must be the ones of out_nostats_bak split
+#in the same way, in the same order, and sample files must be read as sorted ones
+#(with numpy, chromosomes are read as arrays)
+echo "Checking obvious DMCs of samples sorted in natural chromosome order ..."
+. $SCRIPT_DIR/../config.sh
+if ! $PYTHON_EXECUTE -c "import numpy" 2>/dev/null
+then
+	echo "numpy is not installed : positions are examined one by one"
+fi
+split_chromosome='BEGIN {FS=OFS="\t"} NR>1 && $1=="1" {if ($2<40000000) $1="1"; else if ($2<80000000) $1="2"; else if ($2<120000000) $1="10"; else $1="X"} {print}'
+for smp in A1 B1
+do
+	awk "$split_chromosome" data/${smp}_syntheseCpG_chr1.txt > out_natural/${smp}_natural.txt
+done
+$PYTHON_EXECUTE $SCRIPT_DIR/get_obvious_DMC.py DMCs_config_natural.txt out_natural/get_obvious_DMC.log
+ref="out_nostats_bak/obvious_DMCs_Condition A vs B_mincov10_maxcov500_threshold100.0.txt"
+file="out_natural/obvious_DMCs_Condition A vs B_mincov10_maxcov500_threshold100.0.txt"
+if ! awk "$split_chromosome" "$ref" | cmp -s - "$file"
+then
+	echo "'$file' differs from '$ref' split in natural chromosome order"
+	nb_differences=`expr $nb_differences + 1`
+fi
+if grep -q "is not sorted" out_natural/get_obvious_DMC.log
+then
+	echo "Samples sorted in natural chromosome order are read as unsorted ones"
+	nb_differences=`expr $nb_differences + 1`
+fi
+
+if [ $nb_differences -ne 0 ]
+then
+	echo "$nb_differences file(s) differ from reference results !"
+	exit 1
+fi
+echo "All results are identical to reference ones."
@@ -33,15 +33,97 @@
 import os
 import re
 import sys
-from sys import argv
-
+import bisect
+import argparse
+import multiprocessing
+from collections import deque
+
+### Input files are indexed (byte ranges of the lines of each chromosome) and read one chromosome at a time : DMRs
+### of a chromosome are searched, extended with DMCs of the statistical analysis of this chromosome and written before
+### the next chromosome is read, so that memory depends on the size of the largest chromosome.
+### DMRs are written with chromosomes sorted as strings (as in previous versions, so that hypo_N / hyper_N ids do not
+### change), whatever the order of chromosomes in input files. Lines of a chromosome which are not sorted by position
+### are sorted in memory (last line of a position is kept).
+###
+### With --jobs N, DMRs of chromosomes are searched (and extended) by N processes : each one returns DMRs of a chromosome
+### and they are written in chromosome order with hypo_N / hyper_N ids numbered by the main process, so that output
+### files do not depend on the number of processes.
+###
+### Parameters of DMR calling can be swept by listing values in the configuration file :
+###	#sweep_nb_min_DMCs_in_DMRs	2,3,4
+###	#sweep_max_distance_between_DMCs	50,100,200
+###	#sweep_stat_threshold2	0.02,0.05		(DMRs extension)
+### Input files are then read once and DMRs are searched with each combination of values : each setting gets its own
+### DMR txt and bed files (named after its min_DMCs and max_distance values) and a summary table gives the number and
+### total length of DMRs found with each setting.
+
+### Byte ranges of the lines of each chromosome of a file (header excluded) : chromosome -> [[offset, length]].
+### Lines of a chromosome are found in several ranges when the file is not sorted by chromosome.
+def index_file(in_file):
+	ranges={}
+	last_chr=None
+	offset=len(in_file.readline())
+	for line in in_file:
+		idx=line.find("\t")
+		if idx==-1:
+			#Empty line
+			last_chr=None
+		else:
+			chr=line[:idx]
+			if chr==last_chr:
+				ranges[chr][-1][1]+=len(line)
+			else:
+				if chr not in ranges:
+					ranges[chr]=[]
+				ranges[chr].append([offset,len(line)])
+				last_chr=chr
+		offset+=len(line)
+	return ranges
+
+### Lines of a chromosome found by index_file in in_file
+def read_chromosome_lines(in_file,ranges):
+	lines=[]
+	for offset,length in ranges:
+		in_file.seek(offset)
+		lines.extend(in_file.read(length).rstrip("\n").split("\n"))
+	return lines
+
+### Chromosome, position, methylation fold change (last column) of DMCs of a chromosome sorted by position.
+### Files whose lines are not sorted are added to unsorted_files.
+def read_chromosome_DMCs(in_file,file,chr,ranges,unsorted_files):
+	DMCs=[]
+	for line in read_chromosome_lines(in_file,ranges):
+		elmts=line.split("\t")
+		DMCs.append((chr,int(float(elmts[1])),elmts[-1]))
+	if len(ranges)>1:
+		unsorted_files.add(file)
+	for i in range(1,len(DMCs)):
+		if DMCs[i][1]<=DMCs[i-1][1]:
+			#Last line of a position is kept
+			unsorted_files.add(file)
+			positions=dict([(start,fc) for chr,start,fc in DMCs])
+			DMCs=[(chr,start,positions[start]) for start in sorted(positions)]
+			break
+	return DMCs
 
 ###################
 debug=0;
 ###################
 
-config_file=argv[1];
-log_file=argv[2];
+parser=argparse.ArgumentParser()
+parser.add_argument("config_file",help="configuration file of the differential analysis")
+parser.add_argument("log_file",help="log file of the differential analysis")
+parser.add_argument("--jobs",type=int,default=1,help="number of processes searching DMRs of chromosomes in parallel")
+args=parser.parse_args()
+
+if args.jobs < 1:
+	parser.print_help()
+	print "-----------\n"
+	sys.exit("Number of jobs should be a positive integer. Received {0}.".format(args.jobs))
+
+config_file=args.config_file;
+log_file=args.log_file;
+nb_jobs=args.jobs
 
 file_in=""
 from_merge_step=False;
@@ -85,6 +167,9 @@ stat_threshold1=0.01;
 stat_threshold2=0.05;
 output_dir=".";
 only_DMR=False
+min_nb_DMCs_values=None
+max_distances_between_DMCs=None
+stat_thresholds2=None
 
 ###############
 # Read config
@@ -105,6 +190,18 @@ try :
 		if me is not None:
 			max_distance_between_DMCs=int(float(me.group(1)))
 			continue
+		me=re.match("^#sweep_nb_min_DMCs_in_DMRs\t([^#]*)(#.*)?$",line)
+		if me is not None:
+			min_nb_DMCs_values=[int(value) for value in me.group(1).split(",")]
+			continue
+		me=re.match("^#sweep_max_distance_between_DMCs\t([^#]*)(#.*)?$",line)
+		if me is not None:
+			max_distances_between_DMCs=[int(float(value)) for value in me.group(1).split(",")]
+			continue
+		me=re.match("^#sweep_stat_threshold2\t([^#]*)(#.*)?$",line)
+		if me is not None:
+			stat_thresholds2=[float(value) for value in me.group(1).split(",")]
+			continue
 		me=re.match("^#stat_value\t([^#]*)(#.*)?$",line)
 		if me is not None:
 			stat_value=me.group(1)
@@ -156,6 +253,14 @@ if only_DMR:
 if file_in == "" :
 	sys.exit("Do not know from which file containong DMC we should infer DMRs. Exiting.")
 
+sweep=min_nb_DMCs_values is not None or max_distances_between_DMCs is not None or stat_thresholds2 is not None
+if min_nb_DMCs_values is None :
+	min_nb_DMCs_values=[min_nb_DMCs]
+if max_distances_between_DMCs is None :
+	max_distances_between_DMCs=[max_distance_between_DMCs]
+if stat_thresholds2 is None :
+	stat_thresholds2=[stat_threshold2]
+
 
 try:
 	out_log=open(log_file,"at")
@@ -172,222 +277,201 @@ try:
 	if not only_DMR:
 		out_log.write("\t\tstat_threshold2="+str(stat_threshold2)+"\n")
 
+	if sweep:
+		out_log.write("\t\tsweep_min_DMCs="+",".join([str(value) for value in min_nb_DMCs_values])+"\n")
+		out_log.write("\t\tsweep_max_distance="+",".join([str(value) for value in max_distances_between_DMCs])+"\n")
+		if from_merge_step:
+			out_log.write("\t\tsweep_stat_threshold2="+",".join([str(value) for value in stat_thresholds2])+"\n")
+			if max(stat_thresholds2)>stat_threshold2:
+				out_log.write("\t\tWarning : DMCs of the statistical analysis have been selected with stat_threshold2="+str(stat_threshold2)+ \
+					", higher thresholds will not bring more DMCs\n")
+
 	out_log.write("\t\toutput_dir="+output_dir+"\n")
 	out_log.close()
 except IOError as exc:
 	sys.exit("Cannot append to log file '{0}' : {1}".format(log_file,exc))
 
-#####################
-# read list of DMCs
-#####################
-try:
-	DMCs={}
-	in_file=open(file_in,"rt")
-	no_line=0
-	for line in in_file.readlines():
-		no_line+=1
-		if no_line==1:
-			continue
-		line=line.rstrip("\n")
-		elmts=line.split("\t")
-		chr=elmts[0]
-		start=int(float(elmts[1]))
-		fc=elmts[-1]
-		if chr not in DMCs:
-			DMCs[chr]={}
-		DMCs[chr][start]=fc
-	in_file.close()
-except IOError as exc:
-	sys.exit("Cannot read input file '{0}' : {1}".format(file_in,exc))
-
 #####################
 # identify DMRs
 #####################
-def new_DMR() :
-	global nb_DMRs, nb_hypo, nb_hyper
-	if debug :
-		print "DMR ["+str(island_start)+";"+str(last_start)+"] :"+",".join(list_DMCs)
-	out_txt.write(	chr+"\t"+str(island_start)+"\t"+str(last_start)+"\t"+ \
-			str(last_start-island_start)+"\t"+last_fc+"\t" + \
-			",".join(list_DMCs)+"\t"+str(len(list_DMCs))+"\n"
-	)
-	if last_fc == "hypometh":
-		nb_hypo+=1
-		id_DMR="hypo_"+str(nb_hypo)
-		score=-1
-	else :
-		nb_hyper+=1
-		id_DMR="hyper_"+str(nb_hyper)
-		score=1
-
-	out_bed.write(	chr+"\t"+str(island_start)+"\t"+str(last_start)+"\t"+id_DMR+"\t"+str(score)+"\n")
-	if chr not in composition_of_DMRs:
-		composition_of_DMRs[chr]={}
-		DMRs[chr]={}
-	composition_of_DMRs[chr][island_start]=list_DMCs
-	DMRs[chr][island_start]=str(last_start)+"\t"+last_fc
-	nb_DMRs+=1
-
-try :
-	nb_DMRs=nb_hypo=nb_hyper=0
-	composition_of_DMRs={}
+### Line of a DMR in txt files : DMCs composing it are given as strings
+def get_DMR_line(chr,island_start,island_end,fc,list_DMCs):
+	return	chr+"\t"+str(island_start)+"\t"+str(island_end)+"\t"+ \
+		str(island_end-island_start)+"\t"+fc+"\t" + \
+		",".join(list_DMCs)+"\t"+str(len(list_DMCs))+"\n"
+
+### DMRs are written to a txt file (with DMCs composing them) and a bed file (with hypo_N / hyper_N ids)
+class DMR_output :
+	def __init__(self,txt_out,header):
+		self.out_txt=open(txt_out,"wt")
+		self.out_bed=open(txt_out.replace(".txt",".bed"),"wt")
+		self.out_txt.write(header)
+		self.nb_DMRs=self.nb_hypo=self.nb_hyper=0
+		self.total_length=0
+
+	def write(self,chr,island_start,island_end,fc,list_DMCs):
+		self.out_txt.write(get_DMR_line(chr,island_start,island_end,fc,list_DMCs))
+		self.write_bed(chr,island_start,island_end,fc)
+
+	def write_bed(self,chr,island_start,island_end,fc):
+		if fc == "hypometh":
+			self.nb_hypo+=1
+			id_DMR="hypo_"+str(self.nb_hypo)
+			score=-1
+		else :
+			self.nb_hyper+=1
+			id_DMR="hyper_"+str(self.nb_hyper)
+			score=1
+
+		self.out_bed.write(	chr+"\t"+str(island_start)+"\t"+str(island_end)+"\t"+id_DMR+"\t"+str(score)+"\n")
+		self.nb_DMRs+=1
+		self.total_length+=island_end-island_start
+
+	### DMRs of a DMR_block : ids follow those of DMRs already written
+	def write_block(self,block):
+		self.out_txt.write("".join(block.txt_lines))
+		for chr,island_start,island_end,fc in block.DMRs :
+			self.write_bed(chr,island_start,island_end,fc)
+
+	def close(self):
+		self.out_txt.close()
+		self.out_bed.close()
+
+### DMRs of a chromosome found by a process (see --jobs) : they are written later by DMR_output.write_block
+### which gives hypo_N / hyper_N ids
+class DMR_block :
+	def __init__(self):
+		self.txt_lines=[]
+		self.DMRs=[]
+
+	def write(self,chr,island_start,island_end,fc,list_DMCs):
+		self.txt_lines.append(get_DMR_line(chr,island_start,island_end,fc,list_DMCs))
+		self.DMRs.append((chr,island_start,island_end,fc))
+
+### Write DMRs found in DMCs (chromosome, position, methylation fold change sorted by chromosome then position).
+### When keep_DMRs is set, return chromosomes in the order they were found, DMRs (chromosome -> start -> end, fold change)
+### and DMCs composing them (chromosome -> start -> positions) so that they can be extended.
+def identify_DMRs(DMCs,min_nb_DMCs,max_distance_between_DMCs,output,keep_DMRs):
+	DMR_chromosomes=[]
 	DMRs={}
-	out_txt=open(txt_out,"wt")
-	bed_out=txt_out.replace(".txt",".bed")
-	out_bed=open(bed_out,"wt")
-
-	if reference_cond != "" :
-		out_txt.write("Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state for "+reference_cond+"\tList of DMCs\tNumber of DMCs\n")
-	else:
-		out_txt.write("Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state\tList of DMCs\tNumber of DMCs\n")
-
-	for chr in sorted(DMCs.keys()) :
-		island_start=-1
-		last_fc=""
-		last_start=0
-		nb_DMCs=0
-		for start in sorted(DMCs[chr].keys()):
-			fc=DMCs[chr][start]
-
-			'''
-			if start>=5253420 and start<=5255368 :
-				debug=1
-			else:
-				debug=0
-			'''
-			if debug:
-				print "--------"
-				print "start="+str(start)+"/fc="+fc+"/last_fc="+last_fc+"/dist_previous="+str(start-last_start)
-				print "\tisland_start="+str(island_start)+"/nb_DMCs="+str(nb_DMCs)
-			if island_start==-1 :
-				#Start a new candidate for island
-				island_start=start
-				list_DMCs=[str(island_start)]
-				nb_DMCs=1
-			else :
-				if (start-last_start)>max_distance_between_DMCs or last_fc != fc :
-					if debug :
-						if last_fc != fc :
-							print "Stop candidate DMR because of fc."
-						else :
-							print "Stop candidate DMR because of distance : start-last_start="+str(start)+"-"+str(last_start)+"="+ \
-								str(start-last_start)+">"+str(max_distance_between_DMCs)
-							
-					#End of previous candidate DMR
-					if nb_DMCs>=min_nb_DMCs :
-						#This is a DMR
-						new_DMR()
-
-					island_start=start
-					list_DMCs=[str(island_start)]
-					nb_DMCs=1
-				else:
-					list_DMCs.append(str(start))
-					nb_DMCs+=1
-			last_fc=fc
-			last_start=start
-		if nb_DMCs>=min_nb_DMCs :
-			new_DMR()
-
-	out_txt.close()
-	out_bed.close()
-except IOError as exc:
-	sys.exit("Cannot create output file '{0}' : {1}".format(txt_out,exc))
+	composition_of_DMRs={}
 
-try:
-	out_log=open(log_file,"at")
-	out_log.write("RESULT Number of DMRs identified="+str(nb_DMRs)+"\n")
-	out_log.close()
-except IOError as exc:
-	sys.exit("Cannot append to log file '{0}' : {1}".format(log_file,exc))
+	def new_DMR() :
+		if debug :
+			print "DMR ["+str(island_start)+";"+str(last_start)+"] :"+",".join([str(DMC) for DMC in list_DMCs])
+		output.write(last_chr,island_start,last_start,last_fc,[str(DMC) for DMC in list_DMCs])
+		if keep_DMRs:
+			if last_chr not in composition_of_DMRs:
+				composition_of_DMRs[last_chr]={}
+				DMRs[last_chr]={}
+				DMR_chromosomes.append(last_chr)
+			composition_of_DMRs[last_chr][island_start]=list_DMCs
+			DMRs[last_chr][island_start]=(last_start,last_fc)
+
+	last_chr=None
+	last_fc=""
+	last_start=0
+	nb_DMCs=0
+	for chr,start,fc in DMCs :
+		if chr != last_chr :
+			#End of the last candidate DMR of previous chromosome
+			if last_chr is not None and nb_DMCs>=min_nb_DMCs :
+				new_DMR()
+			last_chr=chr
+			island_start=-1
+			last_fc=""
+			last_start=0
+			nb_DMCs=0
+
+		'''
+		if start>=5253420 and start<=5255368 :
+			debug=1
+		else:
+			debug=0
+		'''
+		if debug:
+			print "--------"
+			print "start="+str(start)+"/fc="+fc+"/last_fc="+last_fc+"/dist_previous="+str(start-last_start)
+			print "\tisland_start="+str(island_start)+"/nb_DMCs="+str(nb_DMCs)
+		if island_start==-1 :
+			#Start a new candidate for island
+			island_start=start
+			list_DMCs=[island_start]
+			nb_DMCs=1
+		else :
+			if (start-last_start)>max_distance_between_DMCs or last_fc != fc :
+				if debug :
+					if last_fc != fc :
+						print "Stop candidate DMR because of fc."
+					else :
+						print "Stop candidate DMR because of distance : start-last_start="+str(start)+"-"+str(last_start)+"="+ \
+							str(start-last_start)+">"+str(max_distance_between_DMCs)
+
+				#End of previous candidate DMR
+				if nb_DMCs>=min_nb_DMCs :
+					#This is a DMR
+					new_DMR()
 
+				island_start=start
+				list_DMCs=[island_start]
+				nb_DMCs=1
+			else:
+				list_DMCs.append(start)
+				nb_DMCs+=1
+		last_fc=fc
+		last_start=start
+	if last_chr is not None and nb_DMCs>=min_nb_DMCs :
+		new_DMR()
+	return DMR_chromosomes,DMRs,composition_of_DMRs
 
 #####################
 # Extend DMRs
 #####################
-if from_merge_step :
-	#Try to extend DMRs with DMCs which have a pvalue <stat2Threshold
-	file_stat=step2file["get_diff_methyl.R"];
-
-	txt_out=txt_out.replace("DMRs.txt","DMRs extended.txt")
-	txt_out=txt_out.replace(stat_value+str(stat_threshold1),stat_value+str(stat_threshold2))
-	bed_out=txt_out.replace(".txt",".bed")
-
-	stat_DMCs={}
-	try :
-		in_stat=open(file_stat,"rt")
-		no_line=0
-		for line in in_stat.readlines():
-			no_line+=1
-			if no_line == 1 :
-				continue
-			line=line.rstrip("\n")
-			elmts=line.split("\t")
-			chr=elmts[0]
-			start=int(float(elmts[1]))
-			pv=float(elmts[-3])
-			if pv<stat_threshold1 :
-				continue
-			if pv>=stat_threshold2 :
-				continue
-			
-			fc=elmts[-1]
-			if chr not in stat_DMCs:
-				stat_DMCs[chr]={}
-			stat_DMCs[chr][start]=fc
-
-		in_stat.close()
-	except IOError as exc:
-		sys.exit("Cannot read file resulting from statistical analysis '{0}' : {1}".format(stat_file,exc))
-
+### Extend DMRs with DMCs of stat_DMCs (chromosome -> position -> methylation fold change) and join DMRs
+### getting close enough. Compositions of DMRs are updated and extended DMRs are returned (chromosome -> start -> end, fold change).
+def extend_DMRs(DMR_chromosomes,DMRs,composition_of_DMRs,stat_DMCs,max_distance_between_DMCs):
 	new_DMRs={}
-	for chr in sorted(DMRs.keys()) :
+	for chr in DMR_chromosomes :
 
 		if chr in stat_DMCs :
 			DMCs=sorted(stat_DMCs[chr].keys())
 		else :
 			#No DMC between stat1 and stat2 thresholds in this chromosome
 			DMCs=[]
+		nb_stat_DMCs=len(DMCs)
 
 		extended_DMRs={}
 		for island_start in sorted(DMRs[chr]) :
-			(island_end,fc_DMR)=DMRs[chr][island_start].split("\t")
-			island_end=int(float(island_end))
+			(island_end,fc_DMR)=DMRs[chr][island_start]
 			new_start=island_start
 			new_end=island_end
 			if debug :
 				print "Treating DMR ["+str(island_start)+";"+str(island_end)+"] ("+fc_DMR+")"
 
-			extended_left=False
-			extended_right=False
-			if len(DMCs)!=0 :
-				#Try to extend DMR on the right
-				for idx in range(0,len(DMCs)):
-					if DMCs[idx]>island_end :
-						break
-				extended_right=False
-				while idx<len(DMCs) and DMCs[idx]>island_end and DMCs[idx]-island_end<max_distance_between_DMCs and stat_DMCs[chr][DMCs[idx]] == fc_DMR :
-					extended_right=True
-					if debug :
-						print "\tDMR["+str(island_start)+";"+str(island_end)+"] extended on the right to "+str(DMCs[idx])+" (dist="+str(DMCs[idx]-island_end)+")"
-					composition_of_DMRs[chr][island_start].append(str(DMCs[idx]))
-					idx+=1
-				if extended_right:
-					new_end=DMCs[idx-1]
-	
-				#Try to extend DMR on the left
-				for idx in range(len(DMCs)-1,-1,-1):
-					if DMCs[idx]<island_start :
-						break
-				extended_left=False
-				while idx>=0 and DMCs[idx]<island_start and island_start-DMCs[idx]<max_distance_between_DMCs and stat_DMCs[chr][DMCs[idx]] == fc_DMR :
-					extended_left=True
-					if debug :
-						print "\tDMR["+str(island_start)+";"+str(island_end)+"] extended on the left to "+str(DMCs[idx])+" (dit="+str(island_start-DMCs[idx])+")"
-					composition_of_DMRs[chr][island_start].insert(0,str(DMCs[idx]))
-					idx-=1
-				if extended_left:
-					new_start=DMCs[idx+1]
+			#Try to extend DMR on the right :
+			#DMCs following the DMR end, closer than max_distance to it and with the same fold change
+			first_right=bisect.bisect_right(DMCs,island_end)
+			last_right=first_right
+			while last_right<nb_stat_DMCs and DMCs[last_right]-island_end<max_distance_between_DMCs and stat_DMCs[chr][DMCs[last_right]] == fc_DMR :
+				if debug :
+					print "\tDMR["+str(island_start)+";"+str(island_end)+"] extended on the right to "+str(DMCs[last_right])+" (dist="+str(DMCs[last_right]-island_end)+")"
+				last_right+=1
+			extended_right=last_right!=first_right
+			if extended_right:
+				composition_of_DMRs[chr][island_start].extend(DMCs[first_right:last_right])
+				new_end=DMCs[last_right-1]
+
+			#Try to extend DMR on the left (same rules for DMCs preceding the DMR start)
+			last_left=bisect.bisect_left(DMCs,island_start)
+			first_left=last_left
+			while first_left>0 and island_start-DMCs[first_left-1]<max_distance_between_DMCs and stat_DMCs[chr][DMCs[first_left-1]] == fc_DMR :
+				if debug :
+					print "\tDMR["+str(island_start)+";"+str(island_end)+"] extended on the left to "+str(DMCs[first_left-1])+" (dit="+str(island_start-DMCs[first_left-1])+")"
+				first_left-=1
+			extended_left=first_left!=last_left
+			if extended_left:
+				composition_of_DMRs[chr][island_start][0:0]=DMCs[first_left:last_left]
+				new_start=DMCs[first_left]
 
 			if extended_left or extended_right :
 				if debug:
@@ -396,87 +480,251 @@ if from_merge_step :
 			elif debug :
 				print "DMRs["+str(island_start)+";"+str(island_end)+"] unchanged ("+fc_DMR+")"
 
-			extended_DMRs[new_start]=str(new_end)+"\t"+fc_DMR
-		#Find overlapping DMRs
+			extended_DMRs[new_start]=(new_end,fc_DMR)
+
+		#Join overlapping DMRs : a single sweep through extended DMRs sorted by start,
+		#each one being joined to the previous one if it is close enough and has the same fold change
 		if debug :
 			print "----"
-		while True:
-			has_changed=False
-			new_extended=dict()
-			starts=sorted(extended_DMRs)
-			skip_next=False
-			for idx in range(0,len(starts)-1) :
-				if skip_next :
-					skip_next=False
+		new_DMRs[chr]={}
+		last_start=-1
+		for island_start in sorted(extended_DMRs) :
+			(island_end,fc_DMR)=extended_DMRs[island_start]
+			if last_start!=-1 :
+				(last_end,last_fc)=new_DMRs[chr][last_start]
+				if island_start-last_end<max_distance_between_DMCs and last_fc == fc_DMR :
+					if debug :
+						print "Joining ["+str(last_start)+";"+str(last_end)+"] and ["+str(island_start)+";"+str(island_end)+"]"
+					new_DMRs[chr][last_start]=(island_end,fc_DMR)
+					composition_of_DMRs[chr][last_start].extend(composition_of_DMRs[chr][island_start])
 					continue
-				skip_next=False
-				island_start=starts[idx]
-				(island_end,fc_DMR)=extended_DMRs[island_start].split("\t")
-				island_end=int(float(island_end))
+			new_DMRs[chr][island_start]=(island_end,fc_DMR)
+			last_start=island_start
+	return new_DMRs
+
+### DMCs of a chromosome of the statistical analysis which have a pvalue between stat_threshold1 and the highest
+### stat_threshold2 (chromosome -> position -> pvalue, methylation fold change) : they are used to extend DMRs
+def read_chromosome_stat_values(in_stat,chr,ranges):
+	stat_values={}
+	max_stat_threshold2=max(stat_thresholds2)
+	for line in read_chromosome_lines(in_stat,ranges):
+		elmts=line.split("\t")
+		start=int(float(elmts[1]))
+		pv=float(elmts[-3])
+		if pv<stat_threshold1 :
+			continue
+		if pv>=max_stat_threshold2 :
+			continue
 
-				next_start=starts[idx+1]
-				(next_end,next_fc)=extended_DMRs[next_start].split("\t")
+		fc=elmts[-1]
+		if chr not in stat_values:
+			stat_values[chr]={}
+		stat_values[chr][start]=(pv,fc)
+	return stat_values
+
+### Name of output files for a setting of the parameter sweep
+def get_sweep_file(txt_out,min_nb_DMCs,max_distance_between_DMCs):
+	(base,extension)=os.path.splitext(txt_out)
+	return base+" - min_DMCs"+str(min_nb_DMCs)+" - max_distance"+str(max_distance_between_DMCs)+extension
+
+def get_DMR_file(min_nb_DMCs,max_distance_between_DMCs):
+	if sweep :
+		return get_sweep_file(txt_out,min_nb_DMCs,max_distance_between_DMCs)
+	return txt_out
+
+def get_extended_DMR_file(min_nb_DMCs,max_distance_between_DMCs,stat_threshold2):
+	extended_out=txt_out.replace("DMRs.txt","DMRs extended.txt")
+	extended_out=extended_out.replace(stat_value+str(stat_threshold1),stat_value+str(stat_threshold2))
+	if sweep :
+		extended_out=get_sweep_file(extended_out,min_nb_DMCs,max_distance_between_DMCs)
+	return extended_out
+
+def write_log(text):
+	try:
+		out_log=open(log_file,"at")
+		out_log.write(text)
+		out_log.close()
+	except IOError as exc:
+		sys.exit("Cannot append to log file '{0}' : {1}".format(log_file,exc))
 
-				if next_start-island_end<max_distance_between_DMCs and fc_DMR == next_fc:
-					if debug :
-						print "Joining ["+str(island_start)+";"+str(island_end)+"] and ["+str(next_start)+";"+str(next_end)+"]"
-					new_extended[island_start]=str(next_end)+"\t"+fc_DMR
-					composition_of_DMRs[chr][island_start].extend(composition_of_DMRs[chr][next_start])
-					has_changed=True
-					skip_next=True
-				else :
-					new_extended[island_start]=str(island_end)+"\t"+fc_DMR
-			if not skip_next :
-				idx=len(starts)-1
-				island_start=starts[idx]
-				new_extended[island_start]=extended_DMRs[island_start]
-			
-			if not has_changed:
-				break
-			extended_DMRs=new_extended
-		new_DMRs[chr]={}
+def log_unsorted(file):
+	write_log("\t"+file+" is not sorted by chromosome then position : chromosomes are sorted as they are read\n")
 
-		for start in extended_DMRs :
-			new_DMRs[chr][start]=extended_DMRs[start]
-			composition_of_DMRs[chr][island_start]=set(composition_of_DMRs[chr][island_start])
-	#Output
-	try :
-		out_txt=open(txt_out,"wt")
-		out_bed=open(bed_out,"wt")
-		nb_hypo=nb_hyper=0
-		nb_DMRs=0
-		out_txt.write("Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state for "+reference_cond+"\tList of DMCs\tNumber of DMCs\n")
-		for chr in sorted(new_DMRs.keys()) :
+def log_results(min_nb_DMCs,max_distance_between_DMCs,output,extended_outputs):
+	if sweep :
+		write_log("RESULT Number of DMRs identified (min_DMCs="+str(min_nb_DMCs)+", max_distance="+str(max_distance_between_DMCs)+")="+str(output.nb_DMRs)+"\n")
+		for no_threshold in range(len(extended_outputs)) :
+			write_log("RESULT Number of extended DMRs identified (min_DMCs="+str(min_nb_DMCs)+", max_distance="+str(max_distance_between_DMCs)+ \
+				", stat_threshold2="+str(stat_thresholds2[no_threshold])+")="+str(extended_outputs[no_threshold].nb_DMRs)+"\n")
+	else :
+		write_log("RESULT Number of DMRs identified="+str(output.nb_DMRs)+"\n")
+
+### Extend DMRs found with a setting using each stat_threshold2 (see extend_DMRs) and write them to extended_outputs
+### (one per threshold). stat_values are DMCs of the statistical analysis as read by read_chromosome_stat_values.
+def write_extended_DMRs(DMR_chromosomes,DMRs,composition_of_DMRs,stat_values,max_distance_between_DMCs,extended_outputs):
+	for no_threshold in range(len(stat_thresholds2)) :
+		stat_threshold2=stat_thresholds2[no_threshold]
+		stat_DMCs={}
+		for chr in stat_values :
+			stat_DMCs[chr]={}
+			for start in stat_values[chr] :
+				(pv,fc)=stat_values[chr][start]
+				if pv<stat_threshold2 :
+					stat_DMCs[chr][start]=fc
+
+		if len(stat_thresholds2)>1 :
+			#Compositions are extended : each threshold starts from those of identified DMRs
+			composition=dict([(chr,dict([(start,list(composition_of_DMRs[chr][start])) for start in composition_of_DMRs[chr]])) for chr in composition_of_DMRs])
+		else :
+			composition=composition_of_DMRs
+		new_DMRs=extend_DMRs(DMR_chromosomes,DMRs,composition,stat_DMCs,max_distance_between_DMCs)
+
+		for chr in DMR_chromosomes :
 			for island_start in sorted(new_DMRs[chr]) :
-				nb_DMRs+=1
-				(island_end,fc_DMR)=new_DMRs[chr][island_start].split("\t")
-				island_end=int(float(island_end))
-
-				#Unify and sort list of CpGs
-				list_DMCs=list(sorted(set(composition_of_DMRs[chr][island_start])))
-				out_txt.write(	chr+"\t"+str(island_start)+"\t"+str(island_end)+"\t"+ \
-						str(island_end-island_start)+"\t"+fc_DMR+"\t" + \
-						",".join(list_DMCs)+"\t"+str(len(list_DMCs))+"\n"
-				)
-				if fc_DMR == "hypometh":
-					nb_hypo+=1
-					id_DMR="hypo_"+str(nb_hypo)
-					score=-1
-				else :
-					nb_hyper+=1
-					id_DMR="hyper_"+str(nb_hyper)
-					score=1
-
-				out_bed.write(	chr+"\t"+str(island_start)+"\t"+str(island_end)+"\t"+id_DMR+"\t"+str(score)+"\n")
-			
-		out_txt.close()
-		out_bed.close()	
-	except IOError as exc:
-		sys.exit("Cannot create output file for extended DMRs '{0}' : {1}".format(txt_out,exc))
+				(island_end,fc_DMR)=new_DMRs[chr][island_start]
+
+				#Unify and sort list of CpGs (positions are sorted as strings)
+				list_DMCs=[str(DMC) for DMC in sorted(set(composition[chr][island_start]),key=str)]
+				extended_outputs[no_threshold].write(chr,island_start,island_end,fc_DMR,list_DMCs)
+
+### DMRs (and extended DMRs if stat_values is given) of a chromosome for each setting, as DMR_blocks : run by processes of the pool
+def get_chromosome_DMRs(DMCs,stat_values,settings):
+	blocks=[]
+	for min_nb_DMCs,max_distance_between_DMCs in settings :
+		block=DMR_block()
+		(DMR_chromosomes,DMRs,composition_of_DMRs)=identify_DMRs(DMCs,min_nb_DMCs,max_distance_between_DMCs,block,stat_values is not None)
+		extended_blocks=[]
+		if stat_values is not None :
+			extended_blocks=[DMR_block() for stat_threshold2 in stat_thresholds2]
+			write_extended_DMRs(DMR_chromosomes,DMRs,composition_of_DMRs,stat_values,max_distance_between_DMCs,extended_blocks)
+		blocks.append((block,extended_blocks))
+	return blocks
+
+def write_blocks(blocks,outputs,extended_outputs):
+	for no_setting in range(len(blocks)) :
+		(block,extended_blocks)=blocks[no_setting]
+		outputs[no_setting].write_block(block)
+		for no_threshold in range(len(extended_blocks)) :
+			extended_outputs[no_setting][no_threshold].write_block(extended_blocks[no_threshold])
+
+if reference_cond != "" :
+	DMR_header="Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state for "+reference_cond+"\tList of DMCs\tNumber of DMCs\n"
+else:
+	DMR_header="Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state\tList of DMCs\tNumber of DMCs\n"
+extended_DMR_header="Chromosome\tDMR start\tDMR end\tDMR length\tMethylation state for "+reference_cond+"\tList of DMCs\tNumber of DMCs\n"
+
+settings=[]
+for min_nb_DMCs in min_nb_DMCs_values :
+	for max_distance_between_DMCs in max_distances_between_DMCs :
+		settings.append((min_nb_DMCs,max_distance_between_DMCs))
+
 try:
-	out_log=open(log_file,"at")
-	out_log.write("RESULT Number of extended DMRs identified="+str(nb_DMRs)+"\n")
-	out_log.write("STATUS OK")
-	out_log.close()
+	in_DMCs=open(file_in,"rt")
+	DMC_index=index_file(in_DMCs)
 except IOError as exc:
-	sys.exit("Cannot append to log file '{0}' : {1}".format(log_file,exc))
+	sys.exit("Cannot read input file '{0}' : {1}".format(file_in,exc))
+if from_merge_step :
+	#Used to extend DMRs with DMCs which have a pvalue <stat2Threshold
+	stat_file=step2file["get_diff_methyl.R"]
+	try :
+		in_stat=open(stat_file,"rt")
+		stat_index=index_file(in_stat)
+	except IOError as exc:
+		sys.exit("Cannot read file resulting from statistical analysis '{0}' : {1}".format(stat_file,exc))
+
+pool=None
+if nb_jobs > 1 :
+	#Chromosomes are sent to the processes of the pool, their DMRs are written in chromosome order
+	pool=multiprocessing.Pool(nb_jobs)
+unsorted_files=set()
+try :
+	outputs=[]
+	extended_outputs=[]
+	for min_nb_DMCs,max_distance_between_DMCs in settings :
+		outputs.append(DMR_output(get_DMR_file(min_nb_DMCs,max_distance_between_DMCs),DMR_header))
+		setting_outputs=[]
+		if from_merge_step :
+			for stat_threshold2 in stat_thresholds2 :
+				extended_out=get_extended_DMR_file(min_nb_DMCs,max_distance_between_DMCs,stat_threshold2)
+				setting_outputs.append(DMR_output(extended_out,extended_DMR_header))
+		extended_outputs.append(setting_outputs)
+
+	#Number of chromosomes waiting for a process is bounded to keep memory under control
+	pending=deque()
+	for chr in sorted(DMC_index) :
+		DMCs=read_chromosome_DMCs(in_DMCs,file_in,chr,DMC_index[chr],unsorted_files)
+		chr_stat_values=None
+		if from_merge_step :
+			chr_stat_values=read_chromosome_stat_values(in_stat,chr,stat_index.get(chr,[]))
+		if pool is None :
+			write_blocks(get_chromosome_DMRs(DMCs,chr_stat_values,settings),outputs,extended_outputs)
+			continue
+		pending.append(pool.apply_async(get_chromosome_DMRs,(DMCs,chr_stat_values,settings)))
+		if len(pending) >= 2*nb_jobs:
+			write_blocks(pending.popleft().get(),outputs,extended_outputs)
+	while len(pending) != 0:
+		write_blocks(pending.popleft().get(),outputs,extended_outputs)
+
+	for no_setting in range(len(settings)) :
+		outputs[no_setting].close()
+		for extended_output in extended_outputs[no_setting] :
+			extended_output.close()
+except IOError as exc:
+	sys.exit("Cannot create output files : {0}".format(exc))
+finally:
+	if pool is not None :
+		pool.close()
+		pool.join()
+	in_DMCs.close()
+	if from_merge_step :
+		in_stat.close()
+
+if file_in in unsorted_files :
+	log_unsorted(file_in)
+for no_setting in range(len(settings)) :
+	(min_nb_DMCs,max_distance_between_DMCs)=settings[no_setting]
+	log_results(min_nb_DMCs,max_distance_between_DMCs,outputs[no_setting],extended_outputs[no_setting])
+
+sweep_results=[]
+for no_setting in range(len(settings)) :
+	(min_nb_DMCs,max_distance_between_DMCs)=settings[no_setting]
+	if from_merge_step :
+		for no_threshold in range(len(stat_thresholds2)) :
+			sweep_results.append((min_nb_DMCs,max_distance_between_DMCs,stat_thresholds2[no_threshold],outputs[no_setting],extended_outputs[no_setting][no_threshold]))
+	else :
+		sweep_results.append((min_nb_DMCs,max_distance_between_DMCs,None,outputs[no_setting],None))
+#Last setting for the log
+if from_merge_step :
+	nb_DMRs=extended_outputs[-1][-1].nb_DMRs
+else :
+	nb_DMRs=outputs[-1].nb_DMRs
+
+if sweep :
+	#Summary of DMRs found with each setting
+	summary_out=os.path.splitext(txt_out)[0]+" - parameter sweep.txt"
+	try :
+		out_summary=open(summary_out,"wt")
+		out_summary.write("min_DMCs\tmax_distance")
+		if from_merge_step :
+			out_summary.write("\tstat_threshold2")
+		out_summary.write("\tNumber of DMRs\tTotal length of DMRs")
+		if from_merge_step :
+			out_summary.write("\tNumber of extended DMRs\tTotal length of extended DMRs")
+		out_summary.write("\n")
+		for result in sweep_results :
+			out_summary.write(str(result[0])+"\t"+str(result[1]))
+			if from_merge_step :
+				out_summary.write("\t"+str(result[2]))
+			out_summary.write("\t"+str(result[3].nb_DMRs)+"\t"+str(result[3].total_length))
+			if from_merge_step :
+				out_summary.write("\t"+str(result[4].nb_DMRs)+"\t"+str(result[4].total_length))
+			out_summary.write("\n")
+		out_summary.close()
+	except IOError as exc:
+		sys.exit("Cannot create summary file of parameter sweep '{0}' : {1}".format(summary_out,exc))
+
+if sweep :
+	write_log("RESULT Summary of parameter sweep written to "+summary_out+"\n")
+else :
+	write_log("RESULT Number of extended DMRs identified="+str(nb_DMRs)+"\n")
+write_log("STATUS OK")
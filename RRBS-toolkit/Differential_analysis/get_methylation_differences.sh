@@ -63,6 +63,16 @@ then
 	exit 1
 fi
 
+#Following steps (merge_DMCs.py, get_DMRs.py) use a single output of get_obvious_DMC.py :
+#several contrasts can only be compared by get_obvious_DMC.py run on its own
+contrasts=`grep "^#contrasts2" $configFile | sed 's/^#contrasts2[ \t]*//;s/#.*$//'`
+nbConditions=`sed -n '/^Sample\t/,$p' $configFile | tail -n +2 | cut -f3 | grep -v "^$" | sort -u | wc -l`
+if echo "$contrasts" | grep -q "," || ( echo "$contrasts" | grep -q "\*" && [ $nbConditions -gt 2 ] )
+then
+	echo "Several contrasts are given by 'contrasts2' parameter in your configuration file '$configFile' : differential analysis compares a single pair of conditions. Run get_obvious_DMC.py on its own to get obvious DMCs of several contrasts. Exiting."
+	exit 1
+fi
+
 outputDir=`grep "output_dir" $configFile | sed 's/^#output_dir[ \t]*//'`
 if [ "$outputDir" = "" ]
 then
@@ -142,7 +152,7 @@ then
 	fi
 fi
 
-$PYTHON_EXECUTE $SCRIPT_DIR/get_DMRs.py $configFile $logFile
+$PYTHON_EXECUTE $SCRIPT_DIR/get_DMRs.py --jobs ${DMR_JOBS:-1} $configFile $logFile
 if [ $? -ne 0 ]
 then
 	echo "Step get_DMRs.py has failed" >> $logFile
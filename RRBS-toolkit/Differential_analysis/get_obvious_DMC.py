@@ -34,6 +34,331 @@ import re
 import sys
 from sys import argv
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+#chromosome_order.py is in the RRBS-toolkit directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from chromosome_order import get_chromosome_key
+
+### Sample files are read in lockstep, one chromosome at a time : positions found in all samples are examined as
+### they are read and obvious DMCs are written as soon as they are found, so that memory depends on the size of
+### the largest chromosome, not on the number of positions.
+### Chromosomes are read in natural order (see get_chromosome_key : numeric chromosomes by number, then other
+### chromosomes by name, as written by parse_extract.py) and obvious DMCs are written in this order.
+### Each file is first indexed (byte ranges of the lines of each chromosome), so that a file which is not sorted
+### by chromosome is read in the same way as a sorted one. Lines of a chromosome which are not sorted by position
+### are sorted in memory, for this chromosome and this file only.
+###
+### When numpy is installed, coverages and methylation frequencies of a chromosome are parsed as arrays, aligned
+### on positions found in all samples (positions x samples matrices) and obvious DMCs are selected by array
+### operations. Otherwise positions are examined one by one.
+###
+### By default, the first 2 conditions of the configuration file are compared. Several comparisons can be done
+### with a single read of the sample files by listing them in the configuration file :
+###	#contrasts2	<reference condition> vs <alternative condition>,<reference condition> vs <alternative condition>
+###	#contrasts2	<reference condition> vs *		(reference condition against each other condition)
+### Each contrast is evaluated on the samples of its 2 conditions and gets its own obvious_DMCs_* txt and bed files.
+### Several contrasts are refused by get_methylation_differences.sh, whose following steps use a single obvious DMCs
+### file : they are compared by running get_obvious_DMC.py on its own.
+
+### Yield key, [value of each sample (None if key is not found in sample)] in key order,
+### from readers yielding key, value sorted by key
+def merge_samples(readers):
+	current=[next(reader,None) for reader in readers]
+	while True:
+		keys=[item[0] for item in current if item is not None]
+		if len(keys)==0:
+			return
+		min_key=min(keys)
+		values=[]
+		for i in range(len(readers)):
+			if current[i] is not None and current[i][0]==min_key:
+				values.append(current[i][1])
+				current[i]=next(readers[i],None)
+			else:
+				values.append(None)
+		yield min_key,values
+
+### Yield contrast number, chromosome, position, [(coverage, # C) of each sample of the contrast], methylation difference
+### of obvious DMCs, from (chromosome, position), [CpG of each sample]
+### contrasts : list of (samples of reference condition, samples of alternative condition) given as index in samples
+def get_DMCs(CpGs_by_position,contrasts):
+	for key,CpGs in CpGs_by_position:
+		for no_contrast in range(len(contrasts)):
+			contrast=contrasts[no_contrast]
+			#CpG must be found in all samples of the contrast
+			if None in [CpGs[i] for i in contrast[0]+contrast[1]]:
+				continue
+			values={}
+			avg_occurrences_C={}
+			nb_cond_ok=0
+			for cond in range(2):
+				nb_OK=nb_samples=0
+				avg_occurrences_C[cond]=0
+				tot_coverage=0
+				for i in contrast[cond]:
+					coverage,occurrences_C,main=CpGs[i]
+					if cond not in values:
+						values[cond]=main
+						nb_OK=1
+					else:
+						if values[cond] == main: #Same FC
+							nb_OK+=1
+					nb_samples+=1
+					avg_occurrences_C[cond]+=occurrences_C
+					tot_coverage+=coverage
+
+				avg_occurrences_C[cond]/=tot_coverage
+				avg_occurrences_C[cond]*=100.0
+				if nb_OK==nb_samples:
+					nb_cond_ok+=1
+
+			if nb_cond_ok!=2:
+				continue
+			if values[0] == values[1]:
+				continue
+
+			chr_key,start=key
+			yield no_contrast,chr_key[2],start,[CpGs[i][:2] for i in sorted(contrast[0]+contrast[1])],avg_occurrences_C[0]-avg_occurrences_C[1]
+
+### Parse lines of a chromosome (text without the chromosome column) : return positions, coverages, # C
+### and methylated base (True for C, False for T) of CpGs kept for obvious DMCs search, sorted by position.
+### Files whose lines are not sorted by position are added to unsorted_files.
+def parse_chromosome(file,chromosome,text,min_coverage,max_coverage,pct_threshold,unsorted_files):
+	nb_lines=text.count("\n")
+	nb_columns=text[:text.find("\n")].count("\t")+1
+	values=numpy.fromstring(text,sep="\t")
+	if len(values) == nb_lines*nb_columns:
+		values=values.reshape(nb_lines,nb_columns)
+		positions=values[:,0]
+		coverages=values[:,1].astype(numpy.int64)
+		freq_C=values[:,-1]
+	else:
+		#Some values are not numeric : lines are parsed one by one
+		elmts=[line.rstrip("\r").split("\t") for line in text.split("\n")[:-1]]
+		positions=numpy.array([float(elmt[0]) if re.match("^[0-9]+$",elmt[0]) else -1 for elmt in elmts])
+		coverages=numpy.array([int(float(elmt[1])) for elmt in elmts],dtype=numpy.int64)
+		freq_C=numpy.array([float(elmt[-1]) for elmt in elmts])
+
+	is_C=freq_C>=pct_threshold
+	kept=(coverages>=min_coverage) & (is_C | (freq_C<=100-pct_threshold))
+	if max_coverage!=-1:
+		kept&=coverages<=max_coverage
+	positions=positions[kept]
+	wrong_positions=(positions<0) | (positions!=numpy.floor(positions))
+	if wrong_positions.any():
+		position=text.split("\n")[numpy.flatnonzero(kept)[numpy.flatnonzero(wrong_positions)[0]]].split("\t")[0]
+		sys.exit("Cannot interpret CpG position '"+chromosome+"."+position+"'. Exiting.")
+	positions=positions.astype(numpy.int64)
+	coverages=coverages[kept]
+	occurrences_C=(freq_C[kept]*coverages/100.0).astype(numpy.int64)
+	is_C=is_C[kept]
+	if len(positions) > 1 and not (positions[1:] > positions[:-1]).all():
+		#Sorted in memory : last line of a position is kept
+		unsorted_files.add(file)
+		order=numpy.argsort(positions,kind="mergesort")
+		positions=positions[order]
+		last=numpy.append(positions[1:]!=positions[:-1],True)
+		order=order[last]
+		positions=positions[last]
+		coverages=coverages[order]
+		occurrences_C=occurrences_C[order]
+		is_C=is_C[order]
+	return positions,coverages,occurrences_C,is_C
+
+### Offset of the end of the lines of chromosome found from offset start of chunk
+### (lines of a chromosome are contiguous : the end is searched by bisection)
+def get_chromosome_end(chunk,start,chromosome):
+	prefix=chromosome+"\t"
+	low=start
+	high=chunk.rfind("\n",start,len(chunk)-1)+1
+	if high<=low or chunk.startswith(prefix,high):
+		return len(chunk)
+	#Line starting at low is in chromosome, line starting at high is not
+	while True:
+		middle=chunk.find("\n",(low+high)//2,high-1)+1
+		if middle==0:
+			middle=chunk.find("\n",low,high-1)+1
+			if middle==0:
+				return high
+		if chunk.startswith(prefix,middle):
+			low=middle
+		else:
+			high=middle
+
+#Size of blocks of sample files read at once
+CHUNK_SIZE=1<<23
+
+### Index of a sample file : list of chromosome, [(offset, length) of the lines of chromosome in file] in chromosome
+### order (see get_chromosome_key). Files whose lines of a chromosome are not contiguous or whose chromosomes are
+### not in this order are added to unsorted_files.
+def index_sample(file,unsorted_files):
+	try :
+		in_file=open(file,"rt")
+	except IOError as exc:
+		sys.exit("Cannot open input file '{0}' : {1}".format(file,exc))
+	in_file.readline()
+	offset=in_file.tell()
+	#chromosome => [[offset, length]], chromosomes in order of appearance
+	ranges={}
+	chromosomes=[]
+	#Set when lines of several chromosomes are mixed : ends of chromosomes are then searched line by line
+	is_mixed=False
+	while True:
+		chunk=in_file.read(CHUNK_SIZE)
+		if chunk=="":
+			break
+		if not chunk.endswith("\n"):
+			chunk+=in_file.readline()
+			if not chunk.endswith("\n"):
+				chunk+="\n"
+		start=0
+		while start<len(chunk):
+			if chunk[start]=="\n":
+				#Empty line
+				start+=1
+				continue
+			idx=chunk.find("\t",start,chunk.find("\n",start))
+			if idx==-1:
+				in_file.close()
+				sys.exit("Cannot interpret line '"+chunk[start:chunk.find("\n",start)]+"' of '"+file+"'. Exiting.")
+			chromosome=chunk[start:idx]
+			if not is_mixed:
+				end=get_chromosome_end(chunk,start,chromosome)
+				#All lines of the block must be in chromosome
+				is_mixed=chunk.count("\n"+chromosome+"\t",start,end) != chunk.count("\n",start,end)-1
+			if is_mixed:
+				end=chunk.find("\n",start)+1
+				while end<len(chunk) and chunk.startswith(chromosome+"\t",end):
+					end=chunk.find("\n",end)+1
+			if chromosome not in ranges:
+				ranges[chromosome]=[]
+				chromosomes.append(chromosome)
+			chromosome_ranges=ranges[chromosome]
+			if len(chromosome_ranges)!=0 and sum(chromosome_ranges[-1])==offset+start:
+				chromosome_ranges[-1][1]+=end-start
+			else:
+				chromosome_ranges.append([offset+start,end-start])
+			start=end
+		offset+=len(chunk)
+	in_file.close()
+
+	sorted_chromosomes=sorted(chromosomes,key=get_chromosome_key)
+	if sorted_chromosomes != chromosomes or len(chromosomes) != sum([len(ranges[chromosome]) for chromosome in chromosomes]):
+		unsorted_files.add(file)
+	return [(chromosome,ranges[chromosome]) for chromosome in sorted_chromosomes]
+
+### Lines of a chromosome found by index_sample in in_file, without the chromosome column
+def read_chromosome(in_file,chromosome,ranges):
+	blocks=[]
+	for offset,length in ranges:
+		in_file.seek(offset)
+		block=in_file.read(length)
+		if not block.endswith("\n"):
+			block+="\n"
+		blocks.append(block[len(chromosome)+1:].replace("\n"+chromosome+"\t","\n"))
+	return "".join(blocks)
+
+### Yield (chromosome key, position), (coverage, # C, methylated base) of CpGs of a sample kept for obvious DMCs search,
+### sorted by chromosome (in the order of index) then position
+def read_sample(file,index,min_coverage,max_coverage,pct_threshold,unsorted_files):
+	try :
+		in_file=open(file,"rt")
+	except IOError as exc:
+		sys.exit("Cannot open input file '{0}' : {1}".format(file,exc))
+	for chromosome,ranges in index:
+		chromosome_key=get_chromosome_key(chromosome)
+		CpGs=[]
+		for line in read_chromosome(in_file,chromosome,ranges).split("\n")[:-1]:
+			elmts=line.split("\t")
+			coverage=int(float(elmts[1]))
+			if coverage<min_coverage or (max_coverage!=-1 and coverage>max_coverage) :
+				continue
+
+			freq_C=float(elmts[-1])
+			main="";
+			if freq_C>=pct_threshold :
+				main="C"
+			elif freq_C<=100-pct_threshold :
+				main="T"
+
+			if main == "":
+				continue
+			if re.match("^[0-9]+$",elmts[0]) is None:
+				in_file.close()
+				sys.exit("Cannot interpret CpG position '"+chromosome+"."+elmts[0]+"'. Exiting.")
+			CpGs.append((int(elmts[0]),(coverage,int(freq_C*coverage/100.0),main)))
+
+		for i in range(1,len(CpGs)):
+			if CpGs[i][0]<=CpGs[i-1][0]:
+				#Sorted in memory : last line of a position is kept
+				unsorted_files.add(file)
+				CpGs=sorted(dict(CpGs).items())
+				break
+		for position,CpG in CpGs:
+			yield (chromosome_key,position),CpG
+	in_file.close()
+
+### Yield chromosome key, (positions, coverages, # C, methylated base) of CpGs of a sample kept for obvious
+### DMCs search, one chromosome at a time in the order of index
+def read_sample_chromosomes(file,index,min_coverage,max_coverage,pct_threshold,unsorted_files):
+	try :
+		in_file=open(file,"rt")
+	except IOError as exc:
+		sys.exit("Cannot open input file '{0}' : {1}".format(file,exc))
+	for chromosome,ranges in index:
+		text=read_chromosome(in_file,chromosome,ranges)
+		yield get_chromosome_key(chromosome),parse_chromosome(file,chromosome,text,min_coverage,max_coverage,pct_threshold,unsorted_files)
+	in_file.close()
+
+### Yield contrast number, chromosome, position, [(coverage, # C) of each sample of the contrast], methylation difference
+### of obvious DMCs, from chromosome key, [CpGs of the chromosome of each sample]
+def get_DMCs_numpy(CpGs_by_chromosome,contrasts):
+	for chr_key,CpGs in CpGs_by_chromosome:
+		chr=chr_key[2]
+		for no_contrast in range(len(contrasts)):
+			contrast=contrasts[no_contrast]
+			contrast_samples=sorted(contrast[0]+contrast[1])
+			if None in [CpGs[i] for i in contrast_samples]:
+				continue
+
+			#Positions found in all samples of the contrast
+			positions=CpGs[contrast_samples[0]][0]
+			for i in contrast_samples[1:]:
+				positions=numpy.intersect1d(positions,CpGs[i][0],assume_unique=True)
+			if len(positions) == 0:
+				continue
+
+			#Matrices positions x samples (all samples, columns of samples out of the contrast are not filled)
+			coverages=numpy.ones((len(positions),len(CpGs)),dtype=numpy.int64)
+			occurrences_C=numpy.zeros((len(positions),len(CpGs)),dtype=numpy.int64)
+			is_C=numpy.zeros((len(positions),len(CpGs)),dtype=bool)
+			for i in contrast_samples:
+				idx=numpy.searchsorted(CpGs[i][0],positions)
+				coverages[:,i]=CpGs[i][1][idx]
+				occurrences_C[:,i]=CpGs[i][2][idx]
+				is_C[:,i]=CpGs[i][3][idx]
+
+			values={}
+			avg_occurrences_C={}
+			nb_cond_ok=numpy.zeros(len(positions),dtype=int)
+			for cond in range(2):
+				cond_is_C=is_C[:,contrast[cond]]
+				values[cond]=cond_is_C[:,0]
+				#Same methylated base in all samples of the condition
+				nb_cond_ok+=cond_is_C.all(axis=1) | (~cond_is_C).all(axis=1)
+				avg_occurrences_C[cond]=(occurrences_C[:,contrast[cond]].sum(axis=1) // coverages[:,contrast[cond]].sum(axis=1))*100.0
+
+			selected=numpy.flatnonzero((nb_cond_ok==2) & (values[0]!=values[1]))
+			methyl_diffs=(avg_occurrences_C[0]-avg_occurrences_C[1])[selected].tolist()
+			coverages=coverages[selected][:,contrast_samples].tolist()
+			occurrences_C=occurrences_C[selected][:,contrast_samples].tolist()
+			for i,start in enumerate(positions[selected].tolist()):
+				yield no_contrast,chr,start,zip(coverages[i],occurrences_C[i]),methyl_diffs[i]
+
 config_file=argv[1];
 log_file=argv[2];
 
@@ -45,6 +370,7 @@ max_coverage=-1;
 pct_threshold=100;
 output_dir=".";
 title=""
+contrasts_value=""
 
 if not os.path.isfile(config_file) :
 	sys.exit("Unable to find configuration file for getObviousDMCs : '"+config_file+"'")
@@ -53,6 +379,7 @@ try :
 	reference_cond=alternative_cond=""
 	files=[];
 	samples=[];
+	conds=[]
 	cond2samples={}
 	sample2cond={}
 	file2smp={}
@@ -83,6 +410,10 @@ try :
 		if me is not None:
 			title=me.group(1)
 			continue
+		me=re.match("^#contrasts2\t([^#]*)(#.*)?$",line)
+		if me is not None:
+			contrasts_value=me.group(1)
+			continue
 		if re.match("^Sample\t.*$",line):
 			state=1
 			continue
@@ -98,6 +429,7 @@ try :
 			alternative_cond=cond
 
 		if cond not in cond2samples:
+			conds.append(cond)
 			cond2samples[cond]=""
 		else:
 			cond2samples[cond]+="\t"
@@ -126,145 +458,113 @@ try :
 
 	out_log.write("\t\tmethdiff_threshold2="+str(pct_threshold)+"\n")
 
-	coverages={}
-	occurrences_C={}
-	methyl={}
-	for file in files:
-		smp=file2smp[file]
-		out_log.write("\tReading "+smp+" ...\n")
-		try :
-			in_file=open(file,"rt")
-			no_line=0
-			for line in in_file.readlines():
-				line=line.rstrip("\n")
-				no_line+=1
-				if no_line==1:
-					continue
-				elmts=line.split("\t")
-				id=elmts[0]+"."+elmts[1]
-				coverage=int(float(elmts[2]))
-				if coverage<min_coverage or (max_coverage!=-1 and coverage>max_coverage) :
-					continue
-
-				freq_C=float(elmts[-1])
-				main="";
-				if freq_C>=pct_threshold :
-					main="C"
-				elif freq_C<=100-pct_threshold :
-					main="T"
-				
-				if main == "":
-					continue
-				if id not in coverages:
-					coverages[id]={}
-					occurrences_C[id]={}
-					methyl[id]={}
-
-				coverages[id][smp]=coverage
-				occurrences_C[id][smp]=int(freq_C*coverage/100.0)
-				methyl[id][smp]=main
-				
-
-			in_file.close()
-
-		except IOError as exc:
-			sys.exit("Cannot open input file '{0}' : {1}".format(file,exc))
-
-	final={}
-	for id in methyl.keys():
-		nb_OK=nb_samples=0
-
-		for smp in samples:
-			if smp in methyl[id]:
-				nb_OK+=1
-			nb_samples+=1
-		if nb_OK!=nb_samples:
-			continue
-		values={}
-		avg_occurrences_C={}
-		tot_coverage={}
-		nb_cond_ok=0
-		for cond in cond2samples.keys():
-			nb_OK=nb_samples=0
-			avg_occurrences_C[cond]=0
-			tot_coverage[cond]=0
-			for smp in cond2samples[cond].split("\t"):
-				if cond not in values:
-					values[cond]=methyl[id][smp]
-					nb_OK=1
-				else:
-					if values[cond] == methyl[id][smp]: #Same FC
-						nb_OK+=1
-				nb_samples+=1
-				if smp in coverages[id]:
-					avg_occurrences_C[cond]+=occurrences_C[id][smp]
-					tot_coverage[cond]+=coverages[id][smp]
-
-			avg_occurrences_C[cond]/=tot_coverage[cond]
-			avg_occurrences_C[cond]*=100.0
-			if nb_OK==nb_samples:
-				nb_cond_ok+=1
-	
-		if nb_cond_ok!=2:
-			continue
+	#Contrasts : (reference condition, alternative condition)
+	contrasts=[]
+	if contrasts_value.strip() == "":
+		contrasts.append((reference_cond,alternative_cond))
+	else:
+		for contrast_value in contrasts_value.split(","):
+			contrast=re.split("\s+vs\s+",contrast_value.strip())
+			if len(contrast) != 2:
+				sys.exit("Cannot interpret contrast '"+contrast_value+"' (expected '<condition> vs <condition>' or '<condition> vs *'). Exiting.")
+			for cond in contrast:
+				if cond != "*" and cond not in cond2samples:
+					sys.exit("Unknown condition '"+cond+"' in contrast '"+contrast_value+"'. Exiting.")
+			if contrast[0] == "*":
+				sys.exit("Reference condition expected in contrast '"+contrast_value+"'. Exiting.")
+			if contrast[1] == "*":
+				#Reference condition against each other condition
+				for cond in conds:
+					if cond != contrast[0]:
+						contrasts.append((contrast[0],cond))
+			else:
+				contrasts.append((contrast[0],contrast[1]))
+		out_log.write("\t\tcontrasts2="+",".join([contrast[0]+" vs "+contrast[1] for contrast in contrasts])+"\n")
 
-		conds=cond2samples.keys()
-		if values[conds[0]] == values[conds[1]]:
-			continue
-		me=re.match("^(.*)[.]([0-9]+)$",id)
-		if me is None:
-			sys.exit("Cannot interpret CpG position '"+id+"'. Exiting.")
-		chr=me.group(1)
-		start=int(float(me.group(2)))
-		smp=samples[0]
-		if chr not in final:
-			final[chr]={}
+	#Samples of each condition (index in samples)
+	cond2indexes={}
+	for cond in conds:
+		cond2indexes[cond]=[samples.index(smp) for smp in cond2samples[cond].split("\t")]
 
-		final[chr][start]=avg_occurrences_C[reference_cond]-avg_occurrences_C[alternative_cond]
+	#Output files of each contrast
+	txt_outs=[]
+	for reference,alternative in contrasts:
+		if contrasts_value.strip() == "":
+			contrast_title=title
+			if contrast_title== "" :
+				contrast_title=",".join(cond2samples[reference].split("\t")) + "_" + \
+				      ",".join(cond2samples[alternative].split("\t"))
+		else:
+			contrast_title=reference+" vs "+alternative
+			if title != "":
+				contrast_title=title+" - "+contrast_title
 
-	#Output
-	if title== "" :
-		title=",".join(cond2samples[reference_cond].split("\t")) + "_" + \
-		      ",".join(cond2samples[alternative_cond].split("\t"))
+		txt_out=output_dir+"/obvious_DMCs_"+ \
+			contrast_title + "_mincov"+str(min_coverage)
 
-	txt_out=output_dir+"/obvious_DMCs_"+ \
-		title + "_mincov"+str(min_coverage)
+		if max_coverage != -1 :
+			txt_out+="_maxcov"+str(max_coverage)
 
-	if max_coverage != -1 :
-		txt_out+="_maxcov"+str(max_coverage)
+		txt_out+= "_threshold"+str(pct_threshold)+ \
+			  ".txt"
+		txt_outs.append(txt_out)
+
+	for file in files:
+		out_log.write("\tReading "+file2smp[file]+" ...\n")
 
-	txt_out+= "_threshold"+str(pct_threshold)+ \
-		  ".txt"
-	bed_out=txt_out.replace(".txt",".bed")
+	#Samples of each contrast (index in samples)
+	contrasts_indexes=[(cond2indexes[reference],cond2indexes[alternative]) for reference,alternative in contrasts]
 
+	unsorted_files=set()
+	indexes=[index_sample(file,unsorted_files) for file in files]
 	try :
-		out_txt=open(txt_out,"wt")
-		out_bed=open(bed_out,"wt")
-		out_txt.write("Chromosome\tStart\tEnd")
-		for smp in samples:
-			out_txt.write("\tCov"+smp+"\tFreqC"+smp)
-		smp=samples[0]
-		nb_DMCs=0
-		out_txt.write("\tMethyl diff\tMethylation state in "+reference_cond+"\n")
-		for chr in sorted(final.keys()) :
-			for start in sorted(final[chr].keys()):
-				nb_DMCs+=1
-				out_txt.write(chr+"\t"+str(start)+"\t"+str(start+1))
-				out_bed.write(chr+"\t"+str(start)+"\t"+str(start+1)+"\n")
-				for smp in samples:
-					out_txt.write("\t"+str(coverages[chr+"."+str(start)][smp])+"\t"+str(occurrences_C[chr+"."+str(start)][smp]))
-				out_txt.write("\t"+str(final[chr][start]))
-				if final[chr][start]<0:
-					out_txt.write("\thypometh")
-				else:
-					out_txt.write("\thypermeth")
-				out_txt.write("\n")
-
-		out_txt.close()
-		out_bed.close()
-	
-		out_log.write("RESULT number of obvious DMCs="+str(nb_DMCs)+"\n")
-		out_log.write("OUT "+txt_out+"\n")
+		out_txts=[]
+		out_beds=[]
+		for no_contrast in range(len(contrasts)):
+			out_txt=open(txt_outs[no_contrast],"wt")
+			out_txts.append(out_txt)
+			out_beds.append(open(txt_outs[no_contrast].replace(".txt",".bed"),"wt"))
+			out_txt.write("Chromosome\tStart\tEnd")
+			for i in sorted(contrasts_indexes[no_contrast][0]+contrasts_indexes[no_contrast][1]):
+				out_txt.write("\tCov"+samples[i]+"\tFreqC"+samples[i])
+			out_txt.write("\tMethyl diff\tMethylation state in "+contrasts[no_contrast][0]+"\n")
+		nb_DMCs=[0]*len(contrasts)
+
+		if numpy is not None:
+			readers=[read_sample_chromosomes(files[i],indexes[i],min_coverage,max_coverage,pct_threshold,unsorted_files) for i in range(len(files))]
+			DMCs=get_DMCs_numpy(merge_samples(readers),contrasts_indexes)
+		else:
+			readers=[read_sample(files[i],indexes[i],min_coverage,max_coverage,pct_threshold,unsorted_files) for i in range(len(files))]
+			DMCs=get_DMCs(merge_samples(readers),contrasts_indexes)
+		for no_contrast,chr,start,CpGs,methyl_diff in DMCs:
+			nb_DMCs[no_contrast]+=1
+			out_txt=out_txts[no_contrast]
+			out_txt.write(chr+"\t"+str(start)+"\t"+str(start+1))
+			out_beds[no_contrast].write(chr+"\t"+str(start)+"\t"+str(start+1)+"\n")
+			for coverage,occurrences_C in CpGs:
+				out_txt.write("\t"+str(coverage)+"\t"+str(occurrences_C))
+			out_txt.write("\t"+str(methyl_diff))
+			if methyl_diff<0:
+				out_txt.write("\thypometh")
+			else:
+				out_txt.write("\thypermeth")
+			out_txt.write("\n")
+
+		for no_contrast in range(len(contrasts)):
+			out_txts[no_contrast].close()
+			out_beds[no_contrast].close()
+
+		for file in files:
+			if file in unsorted_files:
+				out_log.write("\t"+file2smp[file]+" is not sorted by chromosome then position : chromosomes are sorted as they are read\n")
+
+		#get_methylation_differences.sh runs this step with a single contrast (the output file used by following steps)
+		for no_contrast in range(len(contrasts)):
+			if len(contrasts) == 1:
+				out_log.write("RESULT number of obvious DMCs="+str(nb_DMCs[no_contrast])+"\n")
+			else:
+				out_log.write("RESULT number of obvious DMCs ("+contrasts[no_contrast][0]+" vs "+contrasts[no_contrast][1]+")="+str(nb_DMCs[no_contrast])+"\n")
+			out_log.write("OUT "+txt_outs[no_contrast]+"\n")
 		out_log.write("STATUS OK\n")
 		out_log.close()
 	except IOError as exc:
@@ -37,32 +37,74 @@ import sys
 from sys import argv
 
 
-### Sort CpG 'chr.position' by chromosome then position
-def CpG_compare(x, y):
-	CpG1=x.split(".")
-	CpG2=y.split(".")
-	if (CpG1[0] == CpG2[0]):
-		#Meme chromosome : on compare numeriquement les coordonnees
-		return int(float(CpG1[1])) - int(float(CpG2[1]))
-	else:
-		#Les chromosomes sont dfifferents : on les compare
-		chr1_is_num=re.match("^[0-9]+$",CpG1[0])
-		chr2_is_num=re.match("^[0-9]+$",CpG2[0])
-		if chr1_is_num!=None and chr2_is_num!=None:
-			#Les 2 chromosomes sont numeriques : on les compare numeriquement
-			return int(float(CpG1[0])) - int(float(CpG2[0]))
-		elif chr1_is_num!=None:
-			#Seule le chromosome 1 est numerique
-			return -1
-		elif chr2_is_num!=None:
-			#Seule le chromosome 2 est numerique
-			return +1
-		else:
-			#Les 2 chromosomes ne sont pas numeriques : on les compare sous forme de chaines
-			if CpG1[0].__lt__(CpG2[0]):
-				return -1
-			else:
-				return +1
+#chromosome_order.py is in the RRBS-toolkit directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from chromosome_order import get_position_key
+
+### DMCs of the statistical analysis and obvious DMCs are read at the same time and merged as they are read, so that
+### the merged file is written without loading the input files in memory.
+### Input files are expected to be sorted by chromosome in natural order (see get_chromosome_key) then position, which
+### is the order obvious DMCs are written in by get_obvious_DMC.py, and the merged file is written in this order.
+### A file found unsorted (e.g. DMCs of the statistical analysis, written in the order of the R package) is read
+### in memory and sorted, then the merge is started again.
+
+class Unsorted_file(Exception):
+	def __init__(self,file):
+		Exception.__init__(self,file)
+		self.file=file
+
+### First line of a file
+def read_header(file):
+	in_file=open(file,"rt")
+	header=in_file.readline().rstrip("\n")
+	in_file.close()
+	return header
+
+### Yield sort key (see get_position_key), line of CpGs of a file (header excluded) sorted by chromosome then position.
+### If stat_pos is given, CpGs with a value above stat_threshold1 in this column are left out.
+### When a position is found on several lines, the last one is kept if keep_last is set, the first one otherwise.
+### The file is closed when the generator is closed before its end.
+def read_CpGs(file,is_sorted,stat_pos=None,keep_last=False):
+	in_file=open(file,"rt")
+	CpGs={}
+	last_CpG=None
+	no_line=0
+	try:
+		for line in in_file:
+			no_line+=1
+			if no_line==1:
+				continue
+			line=line.rstrip("\n")
+			elmts=line.split("\t")
+			if stat_pos is not None and float(elmts[stat_pos]) > stat_threshold1:
+				continue
+			key=get_position_key(elmts[0],int(float(elmts[1])))
+			if not is_sorted:
+				if keep_last or key not in CpGs:
+					CpGs[key]=line
+				continue
+			if last_CpG is not None:
+				if key < last_CpG[0]:
+					raise Unsorted_file(file)
+				if key == last_CpG[0]:
+					if keep_last:
+						last_CpG=(key,line)
+					continue
+				yield last_CpG
+			last_CpG=(key,line)
+	finally:
+		in_file.close()
+	if last_CpG is not None:
+		yield last_CpG
+
+	for key in sorted(CpGs.keys()):
+		yield key,CpGs[key]
+
+### Add an empty pValue/qValue field before last field of a line of obvious DMCs
+def add_stat_field(line,value=""):
+	elmts=line.split("\t")
+	elmts.insert(len(elmts)-2,value)
+	return "\t".join(elmts)
 
 
 ###################
@@ -135,92 +177,74 @@ try:
 	out_log.write("\t\tstat2.threshold="+str(stat_threshold2)+"\n")
 	out_log.write("\t\toutput.dir="+output_dir+"\n")
 
-	CpGs={}
-
-	#Read statistical results
+	#Read headers of statistical results and obvious results
 	if "get_diff_methyl.R" not in step2file:
 		sys.exit("No output file defined fo statistical step. Exiting.")
 
 	stat_file=step2file["get_diff_methyl.R"];
-	in_stat=open(stat_file,"rt")
+	header_stat=read_header(stat_file)
 
-	no_line=0	
 	field2pos={}
-	for line in in_stat.readlines():
-		no_line+=1
-		line=line.rstrip("\n")
-		elmts=line.split("\t")
-		if no_line==1:
-			header_stat=line
-			pos=0
-			for field in elmts:
-				field2pos[field]=pos
-				pos+=1
-			if stat_value not in field2pos:
-				sys.exit("No '"+stat_value+"' field found in header of '"+stat_file+"'.")
-			continue
-		pq_value=float(elmts[field2pos[stat_value]])
-		if pq_value > stat_threshold1:
-			continue
-		id=elmts[0]+"."+elmts[1]
-		CpGs[id]=line
-	in_stat.close()
+	pos=0
+	for field in header_stat.split("\t"):
+		field2pos[field]=pos
+		pos+=1
+	if stat_value not in field2pos:
+		sys.exit("No '"+stat_value+"' field found in header of '"+stat_file+"'.")
 
-	#Read obvious results
-	nb_obvious_added=0
 	if "get_obvious_DMC.py" not in step2file:
 		sys.exit("No output file defined for obvious DMCs discovery step. Exiting.")
 
 	obvious_file=step2file["get_obvious_DMC.py"];
-	in_obvious=open(obvious_file,"rt")
-
-	no_line=0
-	field2pos={}
-	for line in in_obvious.readlines():
-		no_line+=1
-		line=line.rstrip("\n")
-		elmts=line.split("\t")
-		if no_line==1:
-			#Add pValue/qValue field before last field
-			idx=len(elmts)-1
-			elmts.append(elmts[idx])
-			elmts[idx]=elmts[idx-1]
-			elmts[idx-1]=stat_value
-			header_obvious="\t".join(elmts)
-			if header_obvious != header_stat:
-				print "header stat:\n'"+header_stat+"'\n"
-				print "header obvious:\n'"+header_obvious+"'\n"
-				sys.exit("Order of samples in '"+stat_file+"' and '"+obvious_file+"' differs. Exiting.")
-			continue
-		id=elmts[0]+"."+elmts[1]
-		if id not in CpGs:
-			#Add pValue/qValue field before last field
-			idx=len(elmts)-1
-			elmts.append(elmts[idx])
-			elmts[idx]=elmts[idx-1]
-			elmts[idx-1]=""
-			line="\t".join(elmts)
-			CpGs[id]=line
-			nb_obvious_added+=1
-	in_stat.close()
+	#Add pValue/qValue field before last field
+	header_obvious=add_stat_field(read_header(obvious_file),stat_value)
+	if header_obvious != header_stat:
+		print "header stat:\n'"+header_stat+"'\n"
+		print "header obvious:\n'"+header_obvious+"'\n"
+		sys.exit("Order of samples in '"+stat_file+"' and '"+obvious_file+"' differs. Exiting.")
 
 	#Output
 	txt_out=step2file["get_diff_methyl.R"].replace(".txt"," - with obvious DMCs.txt")
 	txt_out=txt_out.replace(stat_value+str(stat_threshold2),stat_value+str(stat_threshold1))
-	out_txt=open(txt_out,"wt")
-	out_txt.write(header_stat+"\n")
-
 	bed_out=txt_out.replace(".txt",".bed")
-	out_bed=open(bed_out,"wt")
-
-	for pos in sorted(CpGs.keys(), cmp=CpG_compare):
-		out_txt.write(CpGs[pos]+"\n")
-		me=re.match("^(.*)[.]([0-9]+)$",pos)
-		if me is None:
-			sys.exit("Cannot interpret CpG position '"+pos+"'. Exiting.")
-		chr=me.group(1)
-		pos=int(float(me.group(2)))
-		out_bed.write(chr+"\t"+str(pos)+"\t"+str(pos+1)+"\n")
+
+	#Obvious DMCs are added to DMCs of the statistical analysis (below stat_threshold1) when not found by it
+	unsorted_files=set()
+	while True:
+		out_txt=open(txt_out,"wt")
+		out_txt.write(header_stat+"\n")
+		out_bed=open(bed_out,"wt")
+		nb_obvious_added=0
+
+		try :
+			stat_CpGs=read_CpGs(stat_file,stat_file not in unsorted_files,field2pos[stat_value],True)
+			obvious_CpGs=read_CpGs(obvious_file,obvious_file not in unsorted_files)
+			stat_CpG=next(stat_CpGs,None)
+			obvious_CpG=next(obvious_CpGs,None)
+			while stat_CpG is not None or obvious_CpG is not None:
+				if obvious_CpG is None or (stat_CpG is not None and stat_CpG[0] <= obvious_CpG[0]):
+					if obvious_CpG is not None and obvious_CpG[0] == stat_CpG[0]:
+						#Obvious DMC already found by the statistical analysis
+						obvious_CpG=next(obvious_CpGs,None)
+					(key,line)=stat_CpG
+					stat_CpG=next(stat_CpGs,None)
+				else:
+					key=obvious_CpG[0]
+					line=add_stat_field(obvious_CpG[1])
+					nb_obvious_added+=1
+					obvious_CpG=next(obvious_CpGs,None)
+				out_txt.write(line+"\n")
+				(chr_key,pos)=key
+				out_bed.write(chr_key[2]+"\t"+str(pos)+"\t"+str(pos+1)+"\n")
+			break
+		except Unsorted_file as exc:
+			#Merge is done again with this file read in memory : the other file is closed before
+			stat_CpGs.close()
+			obvious_CpGs.close()
+			out_txt.close()
+			out_bed.close()
+			out_log.write("\t"+exc.file+" is not sorted by chromosome then position : it is sorted in memory\n")
+			unsorted_files.add(exc.file)
 	out_txt.close()
 	out_bed.close()
 
@@ -47,36 +47,67 @@ ex for BssS1:
 Fragments are size selected or not. Chromosomes scaffolds can be treated or not.
 
 The output is a fragment fasta file that is chromosome sorted. The description line displays the chromosome name, fragment start and stop. 
+Fragments are also written as intervals in a BED file and in a binary fragment index (.idx, see RR_genome_fragment_index.py)
+that other tools can search without parsing the fasta file.
+RR genome parameters are counted during the digestion and written as by RR_genome_parameters.py in the current directory :
+<fragment fasta file name>_results.txt (RR genome size, % of whole genome, number of fragments, number of CpG sites, % of total genomic CpG sites)
+with histograms of fragment lengths (<fragment fasta file name>_length_histogram.txt) and of numbers of CpG sites per fragment (<fragment fasta file name>_CpG_histogram.txt).
+Whole genome size and CpG sites are counted on all records of the genome file, including scaffolds that are not treated.
+Fragments are produced in position order within a chromosome : fragments of each chromosome are kept as a single block and only blocks are sorted.
 
 CG addition : the Python split comand causes the disappearance of all CCGG in the sequences. Then we have to add CCG, CGG and C in the fragments. CGG is always added at the 5' start of the fragments (except for the first one). A C is always added at the 3' end of the fragments. A CG is added to the C at the 3' end of the fragments ONLY if the following fragment is not contiguous.
  
-argument #1 = fasta file genome (sequences must be written on one line only)
+argument #1 = fasta file genome (sequences may be written on one or several lines). A .fai index is written next to it (or reused).
 
 argument #2 = recognition sequence (ie : CCGG for Msp1)
 
 argument #3 = min fragment size, argument #4 = max fragment size (if min = 0 and max = -1, no size selection)
 
+Several digestions can be done with a single read of the genome : argument #2 is then a comma separated list of
+recognition sequences and arguments #3 and #4 comma separated lists of min and max fragment sizes (one size
+window per pair). One fasta file is written for each recognition sequence and size window.
+ex : RR_genome_digestion.py genome.fa CCGG,CCCGGG,CACGAG 40,40,0 220,400,-1 0
+The genome is cut only once per recognition sequence, size windows select among these fragments.
+
 argument #5 = enter "1" if chromosomes scaffolds must be treated
 
+option --jobs N (anywhere on the command line) : chromosomes are digested by N processes.
+Small chromosomes and scaffolds are sent to processes by batches. Processes read sequences of their
+chromosomes from the memory-mapped genome file. At most 2*N batches are waiting for a process or
+being digested, to bound memory.
+
 """
 from string import *
 from sys import argv
+import sys
 import re
 import os
 from os import getcwd
+import multiprocessing
+from collections import deque
+
+from RR_genome_fasta import Indexed_fasta, split_sequence
+from RR_genome_fragment_index import get_fragment_coordinates, write_fragment_index, write_bed
+from RR_genome_stats import RR_genome_stats, write_results, write_histograms
+
+# chromosome_order.py is in the RRBS-toolkit directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chromosome_order import GENOME_NUMERIC_CHROMOSOME, GENOME_REAL_CHROMOSOME, get_genome_chromosome_key
 
 
 ########## FUNCTIONS
 
-def cut_seq(sequence,rest_enz,fragment_number,empty_fragments):
-	coupage_seq = sequence.split(rest_enz)
+def cut_seq(chromosome,pieces,rest_enz,min_frag,max_frag,fragment_number,empty_fragments,fragments,stats):
+	"""
+	pieces : the chromosome sequence split on restriction site (as sequence.split(rest_enz))
+	stats : RR_genome_stats to which selected fragments are added
+	"""
 	start_frag = 1
 	end_frag = 0
 
-	for idx in range(0,len(coupage_seq)):
+	for idx, current_frag in enumerate(pieces):
 		# fragment count incremented
 		####fragment_number = fragment_number + 1
-		current_frag = coupage_seq[idx] 
 
 		if current_frag == '':
 		# if frag is empty, empty frag incremented
@@ -110,7 +141,8 @@ def cut_seq(sequence,rest_enz,fragment_number,empty_fragments):
 					# End if sel_current_frag == 1:
 
 			if sel_last_frag == 1:
-				ofh.write(chromosome +'\t'+ str(start_frag) + '\t'+ str(end_frag) + '\t'+ last_frag + '\n')
+				fragments.append('>' + chromosome + '_' + str(start_frag) + '_' + str(end_frag) + '\n' + last_frag + '\n')
+				stats.add_fragment(last_frag)
 				fragment_number = fragment_number + 1
 				# End if sel_last_frag == 1:
 			# End if not first fragment:
@@ -125,27 +157,173 @@ def cut_seq(sequence,rest_enz,fragment_number,empty_fragments):
 
 	# END for idx in........
 	if sel_last_frag:
-		ofh.write(chromosome +'\t'+ str(start_frag) + '\t'+ str(end_frag) + '\t'+ last_frag +'\n')
+		fragments.append('>' + chromosome + '_' + str(start_frag) + '_' + str(end_frag) + '\n' + last_frag + '\n')
+		stats.add_fragment(last_frag)
 		fragment_number = fragment_number + 1
 	return fragment_number, empty_fragments
 
 
+def get_chromosome(header):
+	"""
+	Chromosome name from fasta description line (">chr1 ..." => "1")
+	"""
+	chromosome = header.split()[0]
+	pattern_chr = re.search("^>([Cc][Hh][Rr])?_?(.*)$",chromosome)
+	if pattern_chr: 
+		chromosome = pattern_chr.group(2)
+	return chromosome
+
+
+def to_treat(header):
+	# scaffolds are not treated: chrUn....
+	chromosome = get_chromosome(header)
+	return GENOME_NUMERIC_CHROMOSOME.match(chromosome) or GENOME_REAL_CHROMOSOME.match(chromosome) or treat_scaffold==1
+
+
+def invalid_line(line):
+	print 'caracteres speciaux trouves', line
+
+
+def ignore_line(line):
+	# invalid lines of chromosomes that are not treated are not reported
+	pass
+
+
+def add_block(blocks, chromosome, block):
+	"""
+	Keep fragments of a chromosome (already sorted by start) until all chromosomes are read
+	"""
+	if chromosome not in blocks:
+		blocks[chromosome] = []
+	blocks[chromosome].append(block)
+
+
+def get_genome_stats(sequence):
+	"""
+	(size, number of CG sites) of a genome record
+	"""
+	return len(sequence), sequence.count('CG')
+
+
+def digest(chromosome, sequence):
+	"""
+	Digest a chromosome for each restriction site and size window.
+	Return a list of (digestion index, fasta fragments, fragments number, empty fragments number, RR genome stats)
+	"""
+	results = []
+	for rest_enz in rest_enzs:
+		# the chromosome is cut once for all size windows
+		pieces = list(split_sequence(sequence,rest_enz))
+		for i in range(len(digestions)):
+			if digestions[i][0] != rest_enz:
+				continue
+			min_frag, max_frag = digestions[i][1:3]
+			fragments = []
+			stats = RR_genome_stats(rest_enz)
+			output_var_from_cut_seq_function = cut_seq(chromosome,pieces,rest_enz,min_frag,max_frag,fragment_number,empty_fragments,fragments,stats)
+			results.append((i, ''.join(fragments), output_var_from_cut_seq_function[0], output_var_from_cut_seq_function[1], stats))
+		del pieces
+	return results
+
+
+def digest_batch(batch):
+	"""
+	Worker : digest a list of (chromosome, index entry, treated) of the genome file (records that are not treated are only counted).
+	Return a list of (chromosome, invalid lines, genome stats, digestion results)
+	"""
+	batch_results = []
+	for chromosome, entry, treated in batch:
+		if not treated:
+			batch_results.append((chromosome, [], get_genome_stats(genome_fasta.get_sequence(entry, ignore_line)), []))
+			continue
+		invalid_lines = []
+		sequence = genome_fasta.get_sequence(entry, invalid_lines.append)
+		if sequence == '':
+			batch_results.append((chromosome, invalid_lines, get_genome_stats(sequence), []))
+		else:
+			batch_results.append((chromosome, invalid_lines, get_genome_stats(sequence), digest(chromosome, sequence)))
+	return batch_results
+
+
+def add_batch_results(batch_results):
+	for chromosome, invalid_lines, genome_stats, results in batch_results:
+		for line in invalid_lines:
+			invalid_line(line)
+		add_genome_stats(genome_stats)
+		add_results(chromosome, results)
+
+
+def add_genome_stats(genome_stats):
+	global genome_size, genome_CG_number
+	genome_size = genome_size + genome_stats[0]
+	genome_CG_number = genome_CG_number + genome_stats[1]
+
+
+def add_results(chromosome, results):
+	for i, block, fragments_nb, empty_nb, stats in results:
+		add_block(digestion_blocks[i], chromosome, block)
+		add_block(digestion_stats[i], chromosome, stats)
+		Fragment_total_numbers[i] = Fragment_total_numbers[i] + fragments_nb
+		empty_fragments_total_numbers[i] = empty_fragments_total_numbers[i] + empty_nb
+
+
+def merge_blocks(chromosome, chromosome_blocks):
+	"""
+	Chromosome found several times in genome file : fragments are sorted by start, then end
+	"""
+	locations = {}
+	for block in chromosome_blocks:
+		lines = block.split('\n')
+		for i in range(0, len(lines)-1, 2):
+			keyLoc = lines[i][1:]
+			if locations.has_key(keyLoc):
+				print "Several lines for chromosome '",chromosome,"' and start=",keyLoc.split('_')[-2]
+			locations[keyLoc] = lines[i] + '\n' + lines[i+1] + '\n'
+	sortedLocations = sorted(locations.keys(), key = lambda keyLoc : (int(keyLoc.split('_')[-2]), int(keyLoc.split('_')[-1])))
+	return ''.join([locations[keyLoc] for keyLoc in sortedLocations])
+
 
 
 
 ################ arguments recall
 
+# number of processes
+nb_jobs = 1
+if "--jobs" in argv:
+	idx = argv.index("--jobs")
+	if idx+1 >= len(argv) or not re.match("^[0-9]+$", argv[idx+1]) or int(argv[idx+1]) < 1:
+		print "Number of jobs incorrect (expect a positive integer) : "," ".join(argv[idx+1:idx+2])
+		exit(1)
+	nb_jobs = int(argv[idx+1])
+	del argv[idx:idx+2]
+
+# a batch of chromosomes sent to a process holds at least BATCH_SIZE bases (or one chromosome)
+BATCH_SIZE = 1<<24
+
+def get_sizes(value, label):
+	sizes = []
+	for size in value.split(','):
+		if not re.match("^-?[0-9]+$", size):
+			print label," parameter incorrect (expect an integer or a comma separated list of integers) : ",value
+			exit(1)
+		sizes.append(int(size))
+	return sizes
+
 # genome fasta file
 input_file = argv[1]
 
-# restriction enzyme recognition sequence
-rest_enz = argv[2]
+# restriction enzyme recognition sequences
+rest_enzs = argv[2].split(',')
 
-# min fragment size
-min_frag = int(argv[3])
+# min fragment sizes
+min_frags = get_sizes(argv[3], "Min fragment size")
 
-# max fragment size : if = -1 no size selection
-max_frag = int(argv[4])
+# max fragment sizes : if = -1 no size selection
+max_frags = get_sizes(argv[4], "Max fragment size")
+
+if len(min_frags) != len(max_frags):
+	print "Min and max fragment sizes should have the same number of values : ",argv[3]," ",argv[4]
+	exit(1)
 
 
 if len(argv)>=6:
@@ -158,33 +336,38 @@ if treat_scaffold!=1 and treat_scaffold!=0:
 	exit(1)
 
 
+# digestions to do : (restriction site, min fragment size, max fragment size, output file)
+digestions = []
+for rest_enz in rest_enzs:
+	for min_frag, max_frag in zip(min_frags, max_frags):
+		if max_frag==-1:
+			output_file2=os.path.abspath(input_file)
+			output_file2=output_file2[:(output_file2.rfind("."))]+"_frag_in_silico_"+rest_enz+".fasta"
+		else:
+			output_file2=os.path.abspath(input_file)
+			output_file2=output_file2[:(output_file2.rfind("."))]+"_frag_in_silico_"+rest_enz+"_"+str(min_frag)+"_"+str(max_frag)+".fasta"
+		digestions.append((rest_enz, min_frag, max_frag, output_file2))
+
+def get_label_selection(min_frag, max_frag):
+	if max_frag==-1:
+		return "No selection"
+	else:
+		return "[" + str(min_frag) + ";" + str(max_frag) +"]"
+
+
 ##################### arguments recall
 print "---------------------------"
 print "Input file :\t",input_file
-print "Restriction site :\t",rest_enz
+print "Restriction site :\t",",".join(rest_enzs)
 
-if max_frag==-1:
-	label_selection="No selection"
-	output_file1=os.path.abspath(input_file)
-	output_file1=output_file1[:(output_file1.rfind("."))]+"_frag_in_silico_"+rest_enz+".tmp"
-
-	output_file2=os.path.abspath(input_file)
-	output_file2=output_file2[:(output_file2.rfind("."))]+"_frag_in_silico_"+rest_enz+".fasta"
-else:
-	label_selection="[" + str(min_frag) + ";" + str(max_frag) +"]"
-	output_file1=os.path.abspath(input_file)
-	output_file1=output_file1[:(output_file1.rfind("."))]+"_frag_in_silico_"+rest_enz+"_"+str(min_frag)+"_"+str(max_frag)+".tmp"
-	
-	output_file2=os.path.abspath(input_file)
-	output_file2=output_file2[:(output_file2.rfind("."))]+"_frag_in_silico_"+rest_enz+"_"+str(min_frag)+"_"+str(max_frag)+".fasta"
-
-print "Size selection :\t",label_selection
+print "Size selection :\t",",".join([get_label_selection(min_frag, max_frag) for min_frag, max_frag in zip(min_frags, max_frags)])
 if treat_scaffold==0:
 	label_scaffold="No"
 else:
 	label_scaffold="Yes"
 print "Treat scaffold :\t",label_scaffold
-print "Output file :\t",output_file2
+for rest_enz, min_frag, max_frag, output_file2 in digestions:
+	print "Output file :\t",output_file2
 print "---------------------------"
 
 
@@ -192,169 +375,127 @@ print "---------------------------"
 
 ############# Variables
 
-Fragment_total_number = 0
 fragment_number = 0
 empty_fragments = 0
-empty_fragments_total_number = 0
-sequence =''
-numericChromosome=re.compile('([Cc][Hh][Rr])?([0-9]+)$')
-realChromosome=re.compile('([Cc][Hh][Rr])?(M[Tt]|X|Y)$')
+
+# for each digestion : fragments total number, empty fragments total number
+Fragment_total_numbers = [0] * len(digestions)
+empty_fragments_total_numbers = [0] * len(digestions)
+
+# for each digestion : chromosome => list of blocks of fasta fragments (one per chromosome record in genome file)
+digestion_blocks = [{} for digestion in digestions]
+
+# for each digestion : chromosome => list of RR genome stats of blocks
+digestion_stats = [{} for digestion in digestions]
+
+# size and number of CG sites of the whole genome
+genome_size = 0
+genome_CG_number = 0
 
 
 
 #######################################################################################
 current_dir = getcwd()
 
-ifh = open(os.path.abspath(input_file))
+genome_file = os.path.abspath(input_file)
 
 pattern = re.search(".fa$",input_file)
 if pattern:
 	input_file = re.sub(".fa$","",input_file)
 
-ofh  = open(output_file1, "w") 
-
-for line in ifh:
-	line = line.rstrip('\r\n')
-	if line.startswith('>'):
-		if sequence !='':
-			output_var_from_cut_seq_function = cut_seq(sequence,rest_enz,fragment_number,empty_fragments)
-			Fragment_total_number = Fragment_total_number + output_var_from_cut_seq_function[0]
-			empty_fragments_total_number = empty_fragments_total_number + output_var_from_cut_seq_function[1]
-
-		line = line.split()
-
-		chromosome = line[0]
-		pattern_chr = re.search("^>([Cc][Hh][Rr])?_?(.*)$",chromosome)
-		if pattern_chr: 
-			chromosome = pattern_chr.group(2)
-
-		sequence =''
+genome_fasta = Indexed_fasta(genome_file)
 
-		# scaffolds are not treated: chrUn....
-		toTreat=0
-		if (numericChromosome.match(chromosome) or realChromosome.match(chromosome) or treat_scaffold==1):
-			toTreat=1
-		     
-	else:
-		if toTreat==0:
-			continue
-
-		line = line.upper()
-		# Test if line matching (^[AGTCN]*$ ) if non return error
-		if re.match ('^[AGTCN]*$', line):
-			sequence=sequence+line
+def get_entries():
+	"""
+	yield (chromosome, index entry, treated) of records of the genome file
+	"""
+	for entry in genome_fasta.index:
+		header = genome_fasta.get_header(entry)
+		if header is not None and to_treat(header):
+			yield get_chromosome(header), entry, True
 		else:
-			print 'caracteres speciaux trouves', line
-		
-	# End if line starts with >
-
-
-
-if sequence !='':
-# last fragment to treat
+			yield None, entry, False
 
-	output_var_from_cut_seq_function = cut_seq(sequence,rest_enz,fragment_number,empty_fragments)
-	Fragment_total_number = Fragment_total_number + output_var_from_cut_seq_function[0]
-	empty_fragments_total_number = empty_fragments_total_number + output_var_from_cut_seq_function[1]
+if nb_jobs == 1:
+	for chromosome, entry, treated in get_entries():
+		if not treated:
+			add_genome_stats(get_genome_stats(genome_fasta.get_sequence(entry, ignore_line)))
+			continue
+		sequence = genome_fasta.get_sequence(entry, invalid_line)
+		add_genome_stats(get_genome_stats(sequence))
+		if sequence != '':
+			add_results(chromosome, digest(chromosome, sequence))
+else:
+	# processes share the memory-mapped genome file, results are added in genome file order
+	pool = multiprocessing.Pool(nb_jobs)
+	pending = deque()
+	batch = []
+	batch_size = 0
+	for chromosome, entry, treated in get_entries():
+		batch.append((chromosome, entry, treated))
+		# length of the sequence
+		batch_size = batch_size + entry[1]
+		if batch_size >= BATCH_SIZE:
+			pending.append(pool.apply_async(digest_batch, (batch,)))
+			batch = []
+			batch_size = 0
+			if len(pending) >= 2*nb_jobs:
+				add_batch_results(pending.popleft().get())
+	if len(batch) != 0:
+		pending.append(pool.apply_async(digest_batch, (batch,)))
+	while len(pending) != 0:
+		add_batch_results(pending.popleft().get())
+	pool.close()
+	pool.join()
+
+genome_fasta.close()
 
 #FinSi
 
-print "Fragments total number = ", Fragment_total_number
-print 'Empty fragments total number = ', empty_fragments_total_number
-
-ifh.close()
-ofh.close()
+for i in range(len(digestions)):
+	if len(digestions) != 1:
+		print "Output file :\t",digestions[i][3]
+	print "Fragments total number = ", Fragment_total_numbers[i]
+	print 'Empty fragments total number = ', empty_fragments_total_numbers[i]
 
 
 
 ########## SORTING Chromosomes
 
-file_1 = open(output_file1)
-ofh = open(output_file2, "w")  
-
-locations={}
-
-print "Sorting initialization..."
-for line in file_1:
-	line = line.rstrip('\n\r')
-	elmts = line.split("\t")
-	chr = elmts[0]
-	start = elmts[1]
-	end = elmts[2]
-	sequ = elmts[3]
-	keyLoc = chr + "_"+ start+ "_"+ end
-	if locations.has_key(keyLoc):
-		print "Several lines for chromosome '",chr,"' and start=",start
-	locations[keyLoc]=sequ
-
+for i in range(len(digestions)):
+	rest_enz, min_frag, max_frag, output_file2 = digestions[i]
+	blocks = digestion_blocks[i]
+	RR_stats = RR_genome_stats(rest_enz)
 
-file_1.close()
+	ofh = open(output_file2, "w")  
 
-#print locations
+	# (chromosome, starts, ends) of fragments for the fragment index and BED file
+	fragment_coordinates = []
 
-def sortChromosomeAndStart_V2(keyLoc1, keyLoc2):
-
-	# split the keyloc with regards to the underscore between the chromosome and the start
-
-	m1=re.match("^(.*)_([0-9]+)_([0-9]+)$",keyLoc1)
-	if m1 is None :
-		sys.exit("Cannot interpret chromosome location '"+keyLoc1+"'. Exiting.")
-
-	m2=re.match("^(.*)_([0-9]+)_([0-9]+)$",keyLoc2)
-	if m2 is None :
-		sys.exit("Cannot interpret chromosome location '"+keyLoc2+"'. Exiting.")
-
-	loc1 = (m1.group(1),m1.group(2))
-	loc2 = (m2.group(1),m2.group(2))
-
-	if (loc1[0] == loc2[0]):
-		# if same chromosome : sort on start
-		return int(loc1[1])-int(loc2[1])
-	else:
-		m = numericChromosome.match(loc1[0])
-		if m:
-			# group : return the string matched by the RE
-			chr1 = m.group(2)
-			m = numericChromosome.match(loc2[0])
-			if m:
-				chr2 = m.group(2)
-				#Compare chromosome number
-				return int(chr1)-int(chr2)
-				
-			else:
-				return -1
+	for chromosome in sorted(blocks.keys(), key = get_genome_chromosome_key):
+		if len(blocks[chromosome]) == 1:
+			block = blocks[chromosome][0]
+			RR_stats.add(digestion_stats[i][chromosome][0])
 		else:
-			m = numericChromosome.match(loc2[0])
-			if m:
-				return 1
-			else: #Neither chr1 nor chr2 are numeric
-			      
-				m1 = realChromosome.match(loc1[0])
-				m2 = realChromosome.match(loc2[0])
-				if m1 and m2:
-					if loc1[0] < loc2[0]:
-						return -1
-					else:
-						return 1
-				elif m1:
-					return -1
-				elif m2:
-					return 1
-				else:
-					#Compare letters
-					if loc1[0] < loc2[0]:
-						return -1
-					else:
-						return 1
-
-
-sortedLocations = sorted(locations.keys(), cmp = sortChromosomeAndStart_V2)
-
-for keyLoc in sortedLocations:
-
-	ofh.write('>' + keyLoc + '\n' + locations[keyLoc] + '\n')
-
-
-os.chmod(output_file2, 0775)
-os.remove(output_file1)
-ofh.close()
+			block = merge_blocks(chromosome, blocks[chromosome])
+			# fragments found in several blocks are written once
+			RR_stats.add_fasta_block(block)
+		ofh.write(block)
+		starts, ends = get_fragment_coordinates(block)
+		fragment_coordinates.append((chromosome, starts, ends))
+		del blocks[chromosome]
+		del digestion_stats[i][chromosome]
+		del block
+
+
+	os.chmod(output_file2, 0775)
+	ofh.close()
+
+	output_file_prefix = output_file2[:output_file2.rfind(".")]
+	write_fragment_index(output_file_prefix + ".idx", fragment_coordinates)
+	write_bed(output_file_prefix + ".bed", fragment_coordinates)
+
+	# RR genome parameters, as written by RR_genome_parameters.py
+	sample = os.path.basename(output_file2)
+	write_results(sample + "_results.txt", sample, RR_stats, genome_size, genome_CG_number)
+	write_histograms(sample, RR_stats)
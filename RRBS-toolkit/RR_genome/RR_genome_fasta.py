@@ -0,0 +1,219 @@
+#
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Reading of genome and fragment fasta files shared by RR_genome_digestion.py and RR_genome_parameters.py
+
+Fasta files may be wrapped on several lines. They are read through mmap with a .fai index
+(built next to the fasta file if needed), so a record can be read without reading the others.
+Lines of a record are upper-cased and joined once per record. Lines holding other characters
+than A, G, T, C and N are reported and left out of the sequence.
+Restriction sites are located with str.find.
+"""
+
+import os
+import mmap
+
+# characters allowed in sequences
+DNA_CHARACTERS='AGTCN'
+
+def is_dna(sequence):
+	return sequence.translate(None, DNA_CHARACTERS) == ''
+
+def get_sequence(data, invalid_line):
+	"""
+	Sequence of a record from the text following its description line : only lines made of
+	DNA characters are kept, invalid_line(line) is called for the others
+	"""
+	if '\r' not in data:
+		sequence = data.replace('\n', '').upper()
+		if is_dna(sequence):
+			return sequence
+
+	#At least one line is not valid : lines are checked one by one
+	valid_lines = []
+	for line in data.split('\n'):
+		line = line.rstrip('\r\n').upper()
+		if is_dna(line):
+			valid_lines.append(line)
+		else:
+			invalid_line(line)
+	return ''.join(valid_lines)
+
+def build_index(fasta):
+	"""
+	Index of records as in samtools faidx : (name, length, offset, line bases, line width)
+	offset is the position of the first base of the record in the file.
+	"""
+	index = []
+	size = len(fasta)
+	header_start = 0
+	if fasta[:1] != '>':
+		header_start = fasta.find('\n>')
+		if header_start == -1:
+			header_start = size
+		else:
+			header_start = header_start + 1
+		if header_start != 0:
+			#text found before the first description line is indexed as a record without name
+			index.append(get_index_entry(fasta, None, 0, header_start))
+
+	while header_start < size:
+		header_end = fasta.find('\n', header_start)
+		if header_end == -1:
+			header_end = size
+		name = fasta[header_start+1:header_end].split()
+		if len(name) != 0:
+			name = name[0]
+		else:
+			name = ''
+		offset = min(header_end+1, size)
+		end = fasta.find('\n>', header_end)
+		if end == -1:
+			end = size
+		else:
+			end = end + 1
+		index.append(get_index_entry(fasta, name, offset, end))
+		header_start = end
+	return index
+
+def get_index_entry(fasta, name, offset, end):
+	data = fasta[offset:end]
+	line_end = data.find('\n')
+	if line_end == -1:
+		line_width = line_bases = len(data)
+	else:
+		line_width = line_end + 1
+		line_bases = len(data[:line_end].rstrip('\r'))
+	length = len(data) - data.count('\n') - data.count('\r')
+	return (name, length, offset, line_bases, line_width)
+
+def write_index(index, index_file):
+	try:
+		ofh = open(index_file, 'w')
+	except IOError:
+		#index is only kept in memory
+		return
+	for name, length, offset, line_bases, line_width in index:
+		if name is None:
+			continue
+		ofh.write(name + '\t' + str(length) + '\t' + str(offset) + '\t' + str(line_bases) + '\t' + str(line_width) + '\n')
+	ofh.close()
+
+def read_index(index_file):
+	index = []
+	for line in open(index_file):
+		elmts = line.rstrip('\r\n').split('\t')
+		index.append((elmts[0], int(elmts[1]), int(elmts[2]), int(elmts[3]), int(elmts[4])))
+	return index
+
+class Indexed_fasta :
+	"""
+	Fasta file read through mmap. Records are found with a .fai index (as written by samtools faidx),
+	reused when it is more recent than the fasta file and built otherwise (and written if keep_index).
+	"""
+
+	def __init__(self, filename, keep_index=True):
+		self.filename = filename
+		self.fh = open(filename, 'rb')
+		if os.path.getsize(filename) == 0:
+			self.fasta = ''
+		else:
+			self.fasta = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+		index_file = filename + '.fai'
+		if os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(filename):
+			self.index = read_index(index_file)
+			if len(self.fasta) != 0 and self.fasta[:1] != '>':
+				#text before the first description line is not in .fai files
+				self.index = build_index(self.fasta)
+		else:
+			self.index = build_index(self.fasta)
+			if keep_index:
+				write_index(self.index, index_file)
+
+	def get_header(self, entry):
+		"""
+		Description line of a record (None for text before the first description line)
+		"""
+		name, length, offset, line_bases, line_width = entry
+		if name is None:
+			return None
+		header_start = self.fasta.rfind('\n', 0, max(offset-1, 0)) + 1
+		return self.fasta[header_start:offset].rstrip('\r\n')
+
+	def get_sequence(self, entry, invalid_line):
+		name, length, offset, line_bases, line_width = entry
+		#record ends before the next description line
+		end = self.fasta.find('\n>', max(offset-1, 0))
+		if end == -1:
+			end = len(self.fasta)
+		else:
+			end = end + 1
+		return get_sequence(self.fasta[offset:end], invalid_line)
+
+	def close(self):
+		if self.fasta != '':
+			self.fasta.close()
+		self.fh.close()
+
+def read_fasta(filename, invalid_line, to_treat=None, keep_index=True):
+	"""
+	yield (description line, sequence) of each record of a fasta file.
+	If to_treat is given, sequences of records for which to_treat(description line) is false are not read (sequence is None).
+	"""
+	fasta = Indexed_fasta(filename, keep_index)
+	for entry in fasta.index:
+		header = fasta.get_header(entry)
+		if to_treat is None or header is None or to_treat(header):
+			yield header, fasta.get_sequence(entry, invalid_line)
+		else:
+			yield header, None
+	fasta.close()
+
+def find_sites(sequence, site):
+	"""
+	yield positions (0-based) of non-overlapping occurrences of site, as cut by sequence.split(site)
+	"""
+	position = sequence.find(site)
+	while position != -1:
+		yield position
+		position = sequence.find(site, position + len(site))
+
+def split_sequence(sequence, site):
+	"""
+	yield the same pieces as sequence.split(site), one at a time
+	"""
+	start = 0
+	for position in find_sites(sequence, site):
+		yield sequence[start:position]
+		start = position + len(site)
+	yield sequence[start:]
@@ -0,0 +1,233 @@
+#
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Binary index of the fragments of an in silico digestion (written by RR_genome_digestion.py)
+
+Fragments are described by their chromosome, start and end as in the description lines of the
+fragment fasta file (">chr_start_end"). For each chromosome, sorted starts and ends are stored as
+two integer arrays so that the file can be memory-mapped and searched by bisection without being
+loaded.
+
+File layout :
+	RR_fragment_index	<version>	<integer size in bytes>
+	<number of chromosomes>
+	<chromosome>	<number of fragments>	<offset of starts>	<offset of ends>	<overlapping>	(one line per chromosome)
+	integer arrays (native byte order) at the given offsets
+
+Fragments of a chromosome do not overlap, except when the chromosome was found in several records of
+the genome file (overlapping=1) : ends are then not sorted and lookups scan the fragments.
+
+Usage as a script :
+./RR_genome_fragment_index.py <index file> <chromosome> <position> [<end position>]
+	print fragments containing position (or overlapping [position;end position]) as chromosome, start, end
+"""
+
+import sys
+import os
+import mmap
+import struct
+from array import array
+
+INDEX_VERSION = 1
+
+# struct format of integers according to their size
+integer_formats = {4 : '=i', 8 : '=q'}
+
+def get_fragment_coordinates(fasta_block):
+	"""
+	(starts, ends) of fragments of a block of fasta records of a chromosome (">chr_start_end\nsequence\n"), sorted by start
+	"""
+	starts = array('l')
+	ends = array('l')
+	for header in fasta_block.split('\n')[0::2]:
+		if header == '':
+			continue
+		chromosome, start, end = header[1:].rsplit('_', 2)
+		starts.append(int(start))
+		ends.append(int(end))
+	return starts, ends
+
+def write_fragment_index(index_file, fragments):
+	"""
+	fragments : list of (chromosome, starts, ends) in output order
+	"""
+	item_size = array('l').itemsize
+
+	header = ['RR_fragment_index\t' + str(INDEX_VERSION) + '\t' + str(item_size) + '\n', str(len(fragments)) + '\n']
+	#offsets depend on the size of the header : header is written with offsets of fixed width
+	header_size = len(''.join(header))
+	for chromosome, starts, ends in fragments:
+		header_size = header_size + len(chromosome) + 3*20 + 6
+	#arrays are aligned on integer size
+	offset = header_size + (-header_size % item_size)
+	for chromosome, starts, ends in fragments:
+		overlapping = 0
+		for i in range(1, len(starts)):
+			if ends[i] < ends[i-1] or starts[i] <= ends[i-1]:
+				overlapping = 1
+				break
+		header.append(chromosome + '\t' + str(len(starts)).zfill(20) + '\t' + str(offset).zfill(20) + '\t' + str(offset + len(starts)*item_size).zfill(20) + '\t' + str(overlapping) + '\n')
+		offset = offset + 2*len(starts)*item_size
+
+	ofh = open(index_file, 'wb')
+	header = ''.join(header)
+	ofh.write(header + '\0' * (-len(header) % item_size))
+	for chromosome, starts, ends in fragments:
+		starts.tofile(ofh)
+		ends.tofile(ofh)
+	ofh.close()
+
+def write_bed(bed_file, fragments):
+	"""
+	BED intervals are 0-based : start-1, end
+	"""
+	ofh = open(bed_file, 'w')
+	for chromosome, starts, ends in fragments:
+		ofh.write(''.join([chromosome + '\t' + str(start-1) + '\t' + str(end) + '\n' for start, end in zip(starts, ends)]))
+	ofh.close()
+
+class Fragment_index :
+	"""
+	Point and range lookups of fragments in a memory-mapped fragment index
+	"""
+
+	def __init__(self, index_file):
+		self.fh = open(index_file, 'rb')
+		self.data = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+		elmts = self.data.readline().rstrip('\n').split('\t')
+		if elmts[0] != 'RR_fragment_index' or int(elmts[1]) != INDEX_VERSION:
+			sys.exit("'{0}' is not a fragment index (version {1}).".format(index_file, INDEX_VERSION))
+		self.item_size = int(elmts[2])
+		self.format = integer_formats[self.item_size]
+
+		# chromosome => (number of fragments, offset of starts, offset of ends)
+		self.chromosomes = {}
+		self.chromosomes_order = []
+		self.overlapping = set()
+		for i in range(int(self.data.readline())):
+			chromosome, nb, starts_offset, ends_offset, overlapping = self.data.readline().rstrip('\n').split('\t')
+			self.chromosomes[chromosome] = (int(nb), int(starts_offset), int(ends_offset))
+			self.chromosomes_order.append(chromosome)
+			if overlapping == '1':
+				self.overlapping.add(chromosome)
+
+	def get_chromosomes(self):
+		return self.chromosomes_order
+
+	def get_nb_fragments(self, chromosome):
+		if chromosome not in self.chromosomes:
+			return 0
+		return self.chromosomes[chromosome][0]
+
+	def get_value(self, offset, i):
+		return struct.unpack_from(self.format, self.data, offset + i*self.item_size)[0]
+
+	def bisect_right(self, offset, nb, value):
+		"""
+		Number of values <= value in the sorted array at offset
+		"""
+		low = 0
+		high = nb
+		while low < high:
+			middle = (low + high) // 2
+			if value < self.get_value(offset, middle):
+				high = middle
+			else:
+				low = middle + 1
+		return low
+
+	def bisect_left(self, offset, nb, value):
+		"""
+		Number of values < value in the sorted array at offset
+		"""
+		low = 0
+		high = nb
+		while low < high:
+			middle = (low + high) // 2
+			if self.get_value(offset, middle) < value:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def get_fragment(self, chromosome, position):
+		"""
+		(start, end) of the fragment containing position, None if position is not in a fragment
+		"""
+		if chromosome not in self.chromosomes:
+			return None
+		nb, starts_offset, ends_offset = self.chromosomes[chromosome]
+		i = self.bisect_right(starts_offset, nb, position) - 1
+		while i >= 0:
+			end = self.get_value(ends_offset, i)
+			if end >= position:
+				return (self.get_value(starts_offset, i), end)
+			if chromosome not in self.overlapping:
+				break
+			i = i - 1
+		return None
+
+	def get_fragments(self, chromosome, start, end):
+		"""
+		List of (start, end) of fragments overlapping [start;end]
+		"""
+		if chromosome not in self.chromosomes:
+			return []
+		nb, starts_offset, ends_offset = self.chromosomes[chromosome]
+		last = self.bisect_right(starts_offset, nb, end)
+		if chromosome in self.overlapping:
+			fragments = [(self.get_value(starts_offset, i), self.get_value(ends_offset, i)) for i in range(0, last)]
+			return [fragment for fragment in fragments if fragment[1] >= start]
+		first = self.bisect_left(ends_offset, nb, start)
+		return [(self.get_value(starts_offset, i), self.get_value(ends_offset, i)) for i in range(first, last)]
+
+	def close(self):
+		self.data.close()
+		self.fh.close()
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 4:
+		print __doc__
+		sys.exit(1)
+
+	fragment_index = Fragment_index(sys.argv[1])
+	chromosome = sys.argv[2]
+	if len(sys.argv) >= 5:
+		fragments = fragment_index.get_fragments(chromosome, int(sys.argv[3]), int(sys.argv[4]))
+	else:
+		fragments = [fragment_index.get_fragment(chromosome, int(sys.argv[3]))]
+	for fragment in fragments:
+		if fragment is not None:
+			print chromosome + '\t' + str(fragment[0]) + '\t' + str(fragment[1])
+	fragment_index.close()
@@ -34,6 +34,7 @@
 
 # usage :
 # ../Scripts/BioInformatics/RR_genome_in_silico.sh <path to genome file> <recognition_sequence> <min_fragment_size> <max_fragment_size> <if_chromosomes_scaffolds_must_be_treated>
+# recognition_sequence, min_fragment_size and max_fragment_size may be comma separated lists (ex : CCGG,CACGAG 40,40 220,400)
 
 if [ "$RRBS_HOME" = "" ]
 then
@@ -132,7 +133,7 @@ if_chromosomes_scaffolds_must_be_treated=$5
 
 (
 
-######### in silico DNA digestion
+######### in silico DNA digestion and RR genome parameters
 $PYTHON_EXECUTE $RR_GENOME_HOME/RR_genome_digestion.py $file $recognition_sequence $min_fragment_size $max_fragment_size $if_chromosomes_scaffolds_must_be_treated
 
 if [ $? -ne 0 ]
@@ -144,25 +145,8 @@ else
 fi
 
 
-if [ "$max_fragment_size" == "-1" ]; 
-then
-	new2=$file_without_suffix"_frag_in_silico_"$recognition_sequence".fasta"
-else
-	new2=$file_without_suffix"_frag_in_silico_"$recognition_sequence"_"$min_fragment_size"_"$max_fragment_size".fasta"
-fi
-
-#output_file_from_dig_genome=$file_without_suffix"_frag_in_silico_"$recognition_sequence"_"$min_fragment_size"_"$max_fragment_size".fasta"
-
-##### in silico RR genome parameters
-$PYTHON_EXECUTE $RR_GENOME_HOME/RR_genome_parameters.py $new2 $file $recognition_sequence
-
-if [ $? -ne 0 ]
-then
-    echo "RR parameters failed !!!"
-    exit 1
-else
-    echo "RR parameters ok"
-fi
+#RR genome parameters (<fragment fasta file>_results.txt and histograms) are written by the digestion :
+#RR_genome_parameters.py is only needed for fragment fasta files produced otherwise
 
 
 ) 1> $path_in/RR_genome_in_silico.log 2>&1
@@ -0,0 +1,241 @@
+#
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+
+"""
+Statistics of a Reduced Representation genome, shared by RR_genome_digestion.py and RR_genome_parameters.py
+
+RR genome size, number of fragments and number of CG sites are counted on fragments without the
+bases added at their end by RR_genome_digestion.py (only for Msp1, XmaC1 and BssS1 recognition
+sequences), as well as histograms of fragment lengths and of numbers of CG sites per fragment.
+
+Fragment fasta files (one sequence line per fragment, as written by RR_genome_digestion.py) are
+counted with numpy when it is installed : the whole file is read as an array of bytes and lengths
+and CG sites of all fragments are computed by vectorised operations. Other files, or all files
+if numpy is missing, are read record by record.
+"""
+
+import os
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from RR_genome_fasta import read_fasta, DNA_CHARACTERS
+
+# bases added at the end of fragments by RR_genome_digestion.py, according to the recognition sequence
+ADDED_BASES = {
+	'CCGG' : 'CG',
+	'CCCGGG' : 'CCGG',
+	'CACGAG' : 'ACGA'
+}
+
+def remove_added_bases(sequence, rest_site):
+	added_bases = ADDED_BASES.get(rest_site)
+	if added_bases is not None and sequence.endswith(added_bases):
+		return sequence[:-len(added_bases)]
+	return sequence
+
+def add_count(histogram, value, count=1):
+	if value in histogram:
+		histogram[value] = histogram[value] + count
+	else:
+		histogram[value] = count
+
+class RR_genome_stats :
+	"""
+	Size, number of fragments and number of CG sites of a RR genome (or of a part of it)
+	"""
+
+	def __init__(self, rest_site):
+		self.rest_site = rest_site
+		self.size = 0
+		self.fragments_number = 0
+		self.CG_number = 0
+		# fragment length => number of fragments
+		self.lengths = {}
+		# number of CG sites in fragment => number of fragments
+		self.CG_counts = {}
+
+	def add_fragment(self, sequence):
+		sequence = remove_added_bases(sequence, self.rest_site)
+		CG_nb = sequence.count('CG')
+		self.size = self.size + len(sequence)
+		self.fragments_number = self.fragments_number + 1
+		self.CG_number = self.CG_number + CG_nb
+		add_count(self.lengths, len(sequence))
+		add_count(self.CG_counts, CG_nb)
+
+	def add(self, stats):
+		self.size = self.size + stats.size
+		self.fragments_number = self.fragments_number + stats.fragments_number
+		self.CG_number = self.CG_number + stats.CG_number
+		for length, count in stats.lengths.items():
+			add_count(self.lengths, length, count)
+		for CG_nb, count in stats.CG_counts.items():
+			add_count(self.CG_counts, CG_nb, count)
+
+	def add_fasta_block(self, block):
+		"""
+		Add fragments of a piece of fragment fasta file (description and sequence lines)
+		"""
+		for sequence in block.split('\n')[1::2]:
+			self.add_fragment(sequence)
+
+
+def get_histogram(values):
+	"""
+	value => number of occurrences, from a numpy array of non-negative integers
+	"""
+	histogram = {}
+	counts = numpy.bincount(values)
+	for value in numpy.flatnonzero(counts):
+		histogram[int(value)] = int(counts[value])
+	return histogram
+
+def add_fragments_array(stats, filename):
+	"""
+	Count fragments of a fasta file with one sequence line per fragment using numpy.
+	Return False (stats unchanged) if the file has another layout.
+	"""
+	data = numpy.fromfile(filename, dtype=numpy.uint8)
+	if len(data) == 0:
+		return True
+	if data[-1] != ord('\n'):
+		data = numpy.append(data, numpy.uint8(ord('\n')))
+
+	line_ends = numpy.flatnonzero(data == ord('\n'))
+	line_starts = numpy.concatenate(([0], line_ends[:-1] + 1))
+	if len(line_starts) % 2 != 0:
+		return False
+	if not (data[line_starts[0::2]] == ord('>')).all():
+		return False
+	starts = line_starts[1::2]
+	ends = line_ends[1::2]
+
+	# sequence lines must hold DNA characters only (this also rejects sequences wrapped on several lines)
+	in_sequence = numpy.zeros(len(data) + 1, dtype=numpy.int8)
+	in_sequence[starts] = in_sequence[starts] + 1
+	in_sequence[ends] = in_sequence[ends] - 1
+	in_sequence = numpy.cumsum(in_sequence[:-1]).astype(bool)
+	dna = numpy.zeros(256, dtype=bool)
+	dna[[ord(c) for c in DNA_CHARACTERS]] = True
+	if not dna[data[in_sequence]].all():
+		return False
+
+	# empty sequences are not fragments
+	lengths = ends - starts
+	starts = starts[lengths != 0]
+	ends = ends[lengths != 0]
+	lengths = lengths[lengths != 0]
+
+	# CG_before[i] : number of CG sites starting before position i of the file
+	CG = (data[:-1] == ord('C')) & (data[1:] == ord('G')) & in_sequence[:-1]
+	CG_before = numpy.concatenate(([0], numpy.cumsum(CG)))
+	CG_counts = CG_before[ends - 1] - CG_before[starts]
+
+	added_bases = ADDED_BASES.get(stats.rest_site)
+	if added_bases is not None:
+		nb_added = len(added_bases)
+		with_added_bases = lengths >= nb_added
+		for i in range(nb_added):
+			with_added_bases = with_added_bases & (data[ends - nb_added + i] == ord(added_bases[i]))
+		# CG sites lost when added bases are removed
+		CG_added = numpy.where(with_added_bases, added_bases.count('CG'), 0)
+		if added_bases[0] == 'G':
+			CG_added = CG_added + (with_added_bases & (lengths > nb_added) & (data[ends - nb_added - 1] == ord('C')))
+		lengths = lengths - numpy.where(with_added_bases, nb_added, 0)
+		CG_counts = CG_counts - CG_added
+
+	stats.size = stats.size + int(lengths.sum())
+	stats.fragments_number = stats.fragments_number + len(lengths)
+	stats.CG_number = stats.CG_number + int(CG_counts.sum())
+	for length, count in get_histogram(lengths).items():
+		add_count(stats.lengths, length, count)
+	for CG_nb, count in get_histogram(CG_counts).items():
+		add_count(stats.CG_counts, CG_nb, count)
+	return True
+
+def read_fragments_stats(filename, rest_site, invalid_line):
+	"""
+	Statistics of the RR genome of a fragment fasta file
+	"""
+	stats = RR_genome_stats(rest_site)
+	if numpy is not None and os.path.getsize(filename) != 0 and add_fragments_array(stats, filename):
+		return stats
+	for header, sequence in read_fasta(filename, invalid_line, keep_index = False):
+		if sequence != '':
+			stats.add_fragment(sequence)
+	return stats
+
+def read_genome_stats(filename, invalid_line):
+	"""
+	(size, number of CG sites) of a genome fasta file
+	"""
+	genome_size = 0
+	CG_number = 0
+	for header, sequence in read_fasta(filename, invalid_line):
+		genome_size = genome_size + len(sequence)
+		CG_number = CG_number + sequence.count('CG')
+	return genome_size, CG_number
+
+
+def write_results(output_file, sample, stats, genome_size, genome_CG_number):
+	"""
+	Table of RR genome parameters : RR genome size, % of whole genome, number of fragments,
+	number of CpG sites and % of total genomic CpG sites
+	"""
+	ofh = open(output_file, "w")
+	ofh.write("Sample"+'\t'+"RR genome size"+'\t'+"% of whole genome"+'\t'+"number of fragments"+'\t'+"number of CpG sites (RR genome)"+'\t'+"% of total genomic CpG sites"+'\n')
+
+	pct_whole_genome = round((stats.size/float(genome_size))*100, 1)
+	pct_CG_whole_genome = round((stats.CG_number/float(genome_CG_number))*100, 1)
+
+	ofh.write(sample+'\t'+str(stats.size)+'\t'+str(pct_whole_genome)+'\t'+str(stats.fragments_number)+'\t'+str(stats.CG_number)+'\t'+str(pct_CG_whole_genome)+'\n')
+	ofh.close()
+
+def write_histograms(output_prefix, stats):
+	"""
+	Write <output_prefix>_length_histogram.txt (fragment length, number of fragments) and
+	<output_prefix>_CpG_histogram.txt (number of CpG sites in fragment, number of fragments)
+	"""
+	ofh = open(output_prefix + "_length_histogram.txt", "w")
+	ofh.write("fragment length"+'\t'+"number of fragments"+'\n')
+	for length in sorted(stats.lengths.keys()):
+		ofh.write(str(length)+'\t'+str(stats.lengths[length])+'\n')
+	ofh.close()
+
+	ofh = open(output_prefix + "_CpG_histogram.txt", "w")
+	ofh.write("number of CpG sites"+'\t'+"number of fragments"+'\n')
+	for CG_nb in sorted(stats.CG_counts.keys()):
+		ofh.write(str(CG_nb)+'\t'+str(stats.CG_counts[CG_nb])+'\n')
+	ofh.close()
@@ -70,51 +70,23 @@ CpG position  |  Only in file_1 | Only in file_2 | Common in file_1 & file_2 | M
 """
 ### FONCTIONS DE TRI
 
-def numeric_compare(x, y):
-	CpG1=re.split("[:-]",x)
-	CpG2=re.split("[:-]",y)
-	if (CpG1[0] == CpG2[0]):
-		#Meme chromosome : on compare numeriquement les coordonnees
-		return int(CpG1[1]) - int(CpG2[1])
-	else:
-		#Les chromosomes sont dfifferents : on les compare
-		chr1_is_num=re.match("^[0-9]+$",CpG1[0])
-		chr2_is_num=re.match("^[0-9]+$",CpG2[0])
-		if chr1_is_num!=None and chr2_is_num!=None:
-			#Les 2 chromosomes sont numeriques : on les compare numeriquement
-			return int(CpG1[0]) - int(CpG2[0])
-		elif chr1_is_num!=None:
-			#Seule le chromosome 1 est numerique
-			return -1
-		elif chr2_is_num!=None:
-			#Seule le chromosome 2 est numerique
-			return +1
-		else:
-			#Les 2 chromosomes ne sont pas numeriques : on les compare sous forme de chaines
-			if CpG1[0].__lt__(CpG2[0]):
-				return -1
-			else:
-				return +1
-
-#Fonction de "patch" pour coder en python3 ce que l'on faisait facilement en python2
-def cmp_to_key(ma_fonction_de_comparaison):
-    'Convert a cmp= function into a key= function'
-    class K(object):
-        def __init__(self, obj, *args):
-            self.obj = obj
-        def __lt__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) < 0
-        def __gt__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) > 0
-        def __eq__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) == 0
-        def __le__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) <= 0
-        def __ge__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) >= 0
-        def __ne__(self, other):
-            return ma_fonction_de_comparaison(self.obj, other.obj) != 0
-    return K
+#chromosome_order.py is in the RRBS-toolkit directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from chromosome_order import get_chromosome_key
+
+def numeric_key(x):
+	"""
+	Sort key of an element 'chromosome:position' (or 'chromosome-position') : chromosome then position
+	"""
+	CpG=re.split("[:-]",x)
+	position=0
+	if len(CpG) > 1:
+		try:
+			position=int(CpG[1])
+		except ValueError:
+			#Position is not numeric : only the chromosome is used
+			pass
+	return (get_chromosome_key(CpG[0]),position)
 
 """
 #Le Test
@@ -125,7 +97,7 @@ result=sorted([
 			"21:1", "21:15", "21:2","21:3", "21:111", "21:4",
 			"Y:1", "Y:15", "Y:2","Y:3", "Y:111", "Y:4",
 			"10:1", "10:15", "10:2","10:3", "10:111", "10:4",
-	     ], key=cmp_to_key(numeric_compare))
+	     ], key=numeric_key)
 
 print(result)
 
@@ -325,7 +297,7 @@ if args.txt_output_file is not None :
 
 #Compute venn sets and produce text output file
 venn_diagram = {}
-for key in sorted(dico_set.keys(), key=cmp_to_key(numeric_compare)):
+for key in sorted(dico_set.keys(), key=numeric_key):
 	# dict for graphic display (outputs a couple "condition:number of stars)
 	if not set_to_title[dico_set[key]] in venn_diagram:
 		venn_diagram[set_to_title[dico_set[key]]] = 1
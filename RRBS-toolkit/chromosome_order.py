@@ -0,0 +1,91 @@
+#
+#----------------------------------------------------------------
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#----------------------------------------------------------------
+#authors :
+#---------
+#	Piumi Francois (francois.piumi@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Jouneau Luc (luc.jouneau@inra.fr)		software conception and development (engineer in bioinformatics)
+#	Gasselin Maxime (m.gasselin@hotmail.fr)		software user and data analysis (PhD student in Epigenetics)
+#	Perrier Jean-Philippe (jp.perrier@hotmail.fr)	software user and data analysis (PhD student in Epigenetics)
+#	Al Adhami Hala (hala_adhami@hotmail.com)	software user and data analysis (postdoctoral researcher in Epigenetics)
+#	Jammes Helene (helene.jammes@inra.fr)		software user and data analysis (research group leader in Epigenetics)
+#	Kiefer Helene (helene.kiefer@inra.fr)		software user and data analysis (principal invertigator in Epigenetics)
+#
+
+"""
+Ordering of chromosomes and positions shared by the toolkit scripts (Python 2 and 3)
+
+Two orderings are used :
+	- get_chromosome_key : chromosomes made of digits sorted numerically, then other chromosomes
+	  sorted as strings (DMC, DMR and Venn tables)
+	- get_genome_chromosome_key : chromosomes made of digits (with an optional 'chr' prefix) sorted
+	  numerically, then MT, X and Y, then other chromosomes and scaffolds (RR genome)
+
+Keys are tuples computed once per chromosome name and cached, so that sort(key=...) runs one regular
+expression per chromosome instead of one per comparison.
+
+Scripts in other directories of the toolkit import this module after adding the RRBS-toolkit
+directory to sys.path.
+"""
+
+import re
+
+NUMERIC_CHROMOSOME = re.compile("^[0-9]+$")
+GENOME_NUMERIC_CHROMOSOME = re.compile("^([Cc][Hh][Rr])?([0-9]+)$")
+GENOME_REAL_CHROMOSOME = re.compile("^([Cc][Hh][Rr])?(M[Tt]|X|Y)$")
+
+# chromosome => sort key
+chromosome_keys = {}
+genome_chromosome_keys = {}
+
+def get_chromosome_key(chromosome):
+	"""
+	Numeric chromosomes by number, then other chromosomes by name
+	"""
+	key = chromosome_keys.get(chromosome)
+	if key is None:
+		if NUMERIC_CHROMOSOME.match(chromosome):
+			key = (0, int(chromosome), chromosome)
+		else:
+			key = (1, 0, chromosome)
+		chromosome_keys[chromosome] = key
+	return key
+
+def get_genome_chromosome_key(chromosome):
+	"""
+	Numeric chromosomes by number, then MT, X and Y, then other chromosomes and scaffolds by name
+	"""
+	key = genome_chromosome_keys.get(chromosome)
+	if key is None:
+		m = GENOME_NUMERIC_CHROMOSOME.match(chromosome)
+		if m:
+			key = (0, int(m.group(2)), chromosome)
+		elif GENOME_REAL_CHROMOSOME.match(chromosome):
+			key = (1, 0, chromosome)
+		else:
+			key = (2, 0, chromosome)
+		genome_chromosome_keys[chromosome] = key
+	return key
+
+def get_position_key(chromosome, position):
+	"""
+	Sort key of a position (position is an integer)
+	"""
+	return (get_chromosome_key(chromosome), position)
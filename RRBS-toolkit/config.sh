@@ -55,4 +55,14 @@ PYTHON_EXECUTE=/usr/local/bioinfo/src/python/Python-2.7.2/bin/python
 #path to the R executable file
 R_EXECUTE=/usr/local/bioinfo/bin/R
 
-export RRBS_HOME BISMARK_PIPELINE_HOME BISMARK_HOME BOWTIE_HOME TRIMGALORE_EXECUTE CUTADAPT_EXECUTE SAMTOOLS_EXECUTE PYTHON_EXECUTE R_EXECUTE
+#number of processes used by parse_extract.py to read a methylation extractor file
+PARSE_EXTRACT_JOBS=1
+
+#number of processes used by get_DMRs.py to search DMRs of chromosomes in parallel
+DMR_JOBS=1
+
+#options of extract_distance_R1R2.py : empty to write one distance per read,
+#"--histogram" to only write the histogram and quantiles of R1<->R2 distances
+DISTANCE_R1R2_OPTIONS=
+
+export RRBS_HOME BISMARK_PIPELINE_HOME BISMARK_HOME BOWTIE_HOME TRIMGALORE_EXECUTE CUTADAPT_EXECUTE SAMTOOLS_EXECUTE PYTHON_EXECUTE R_EXECUTE PARSE_EXTRACT_JOBS DMR_JOBS DISTANCE_R1R2_OPTIONS